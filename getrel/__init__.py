@@ -2,10 +2,11 @@
 def _main():
     try:
         from .cli import app
-        app()
-    except ImportError as e:
+    except ImportError:
         from .simplecli import main 
         main()
+    else:
+        app()
 
 if __name__ == '__main__':
     _main()
@@ -11,6 +11,11 @@ from rich.progress import Progress, TextColumn, BarColumn, DownloadColumn, Trans
 from rich.console import Console
 import re
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 session = Session()
 console = Console()
 
@@ -72,8 +77,12 @@ def download_releases(project: str):
                 progress.update(task_id, advance=len(chunk))
                 file.write(chunk)
         progress.stop_task(task_id)
-        with open(asset['name'] + '.json', 'w') as f:
-            json.dump(releases, f, indent=2)
+        if orjson is not None:
+            with open(asset['name'] + '.json', 'wb') as f:
+                f.write(orjson.dumps(releases, option=orjson.OPT_INDENT_2))
+        else:
+            with open(asset['name'] + '.json', 'w') as f:
+                json.dump(releases, f, indent=2)
 
 
 
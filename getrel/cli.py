@@ -4,19 +4,20 @@ import re
 import sys
 import shutil
 import subprocess
+import typing
 from collections.abc import Mapping
 from datetime import datetime
 from pathlib import Path
-from typing import Collection, Optional, List, Iterable, Tuple
+from stat import S_ISDIR, S_ISLNK
+from functools import lru_cache
+from importlib.util import find_spec
+from itertools import islice
+from typing import Optional, List, Iterable, Tuple, Union
 
 import humanize
 import rich.table
 from humanize import naturaltime
-from prompt_toolkit.document import Document
-from prompt_toolkit.lexers import PygmentsLexer
-from prompt_toolkit.validation import ValidationError, Validator
 import typer
-from pygments.lexers.configs import TOMLLexer
 from rich.live import Live
 from rich.markup import render
 from rich.progress import track
@@ -24,30 +25,40 @@ from rich.table import Table
 from rich.text import Text
 from rich.tree import Tree
 
-from .project import GitHubProject, GithubAsset, get_project, ProjectFile, Release
-import questionary
+from .project import GitHubProject, GithubAsset, get_project, ProjectFile, Release, run_parallel
 from difflib import SequenceMatcher
-import fnmatch
-from itertools import chain
-from .utils import FileType, first, unique_substrings, shorten_list
+from .utils import FileType, first, glob_filter, glob_match, unique_substrings
 from .config import edit_projects, APP_NAME, project_directory, project_state_directory
 
 import logging
-from rich.logging import RichHandler
 from rich.console import Console
-from rich.syntax import Syntax
-import tomlkit
+
+if typing.TYPE_CHECKING:
+    import questionary
+    from rich.logging import RichHandler
+
+# the interactive commands import questionary lazily, but without it the simple CLI should be used
+if find_spec('questionary') is None:
+    raise ImportError('questionary is required for the interactive CLI')
 
 console = Console()
 from . import config
 config.console = console
 
 FORMAT = "%(message)s"
-log_handler = RichHandler(console=console, show_time=False, rich_tracebacks=False)
-logging.basicConfig(
-        level="NOTSET", format=FORMAT, datefmt="[%X]", handlers=[log_handler]
-)
 logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _log_handler() -> 'RichHandler':
+    """Configures logging on first use, so --help does not need to load it."""
+    from rich.logging import RichHandler
+    handler = RichHandler(console=console, show_time=False, rich_tracebacks=False)
+    logging.basicConfig(
+            level="NOTSET", format=FORMAT, datefmt="[%X]", handlers=[handler]
+    )
+    return handler
+
 app = typer.Typer(pretty_exceptions_enable=False)
 
 @app.callback(invoke_without_command=True)
@@ -56,39 +67,15 @@ def initialize(ctx: typer.Context,
                quiet: int = typer.Option(0, '--quiet', '-q', count=True, help="less messages", show_default=False, show_choices=False),
                ):
     log_level = min(logging.CRITICAL, max(0, logging.WARNING + (10 * (quiet - verbose))))
-    log_handler.setLevel(log_level)
+    _log_handler().setLevel(log_level)
+    logging.getLogger().setLevel(log_level)   # lets logger.debug() & co. bail out before creating records
     if not ctx.invoked_subcommand:
         app(['status'])
 
 
 
-class FNMatchValidator(Validator):
-
-    def __init__(self, candidates: Collection[str] = tuple(), *,
-                 must_match: Optional[str]=None,
-                 max_matches: Optional[int] = None,
-                 min_matches: Optional[int] = None):
-        super().__init__()
-        self.candidates = list(candidates or [])
-        self.must_match = must_match
-        if must_match is not None and must_match in self.candidates:
-            self.candidates.append(must_match)
-        self.max_matches = max_matches
-        self.min_matches = min_matches
-
-
-    def validate(self, document: Document) -> None:
-        matches = {c for c in self.candidates if fnmatch.fnmatch(c, document.text)}
-        if self.must_match is not None and self.must_match not in matches:
-            raise ValidationError(message=f'"{document.text}" does not match {self.must_match}: {matches}')
-        elif self.max_matches is not None and len(matches) > self.max_matches:
-            raise ValidationError(message=f'matches {len(matches)} items ({", ".join(matches)})')
-        elif self.min_matches is not None and len(matches) < self.min_matches:
-            raise ValidationError(message=f'matches only {len(matches)} instead of {self.min_matches} items')
-
-
-
-def rel2choice(ghrelease: Mapping, special=None) -> questionary.Choice:
+def rel2choice(ghrelease: Mapping, special=None) -> 'questionary.Choice':
+    import questionary
     title = ghrelease["tag_name"]
     name = ghrelease.get('name')
     if name and name != title:
@@ -99,17 +86,21 @@ def rel2choice(ghrelease: Mapping, special=None) -> questionary.Choice:
         title += ' (prerelease)'
     return questionary.Choice(title, value=special or ghrelease["tag_name"])
 
-def asset2choice(asset: GithubAsset) -> questionary.Choice:
+def asset2choice(asset: GithubAsset) -> 'questionary.Choice':
+    import questionary
     return questionary.Choice(str(asset), value=asset, checked=asset.configured)
 
 
-def _configure_file(project: GitHubProject, source: Path, detailed: bool = False):
+def _configure_file(project: GitHubProject, source: Path, detailed: bool = False, kind: Optional[FileType] = None):
     """
-    Interactively prepares an install rule for the given file or asset.
+    Interactively prepares an install rule for the given file or asset. kind may be passed if it is already known.
     """
+    import questionary
+    import tomlkit
     action = None
     arg = None
-    kind = FileType(source)
+    if kind is None:
+        kind = FileType(source)
     if kind.archive:
         action = "unpack"
     elif kind.executable:
@@ -161,6 +152,10 @@ def add(url: str, detailed: bool = typer.Option(False, "-d", "--detailed",
     """
     Interactively install a tool and add its configuration.
     """
+    import questionary
+    import tomlkit
+    from rich.syntax import Syntax
+    from .validators import FNMatchValidator
     with edit_projects() as settings:
         project = get_project(url, must_exist=False)
         if project.configured:
@@ -189,8 +184,14 @@ def add(url: str, detailed: bool = typer.Option(False, "-d", "--detailed",
 
             if sum(c.checked for c in asset_choices) == 0:
                 # Try to guess and preselect a sensible subset of asset choices
-                preselected_assets = shorten_list(asset_choices, lambda choice: platform.system().casefold() in choice.value.source.name.casefold())
-                preselected_assets = shorten_list(preselected_assets, lambda choice: platform.machine().casefold() in choice.value.source.name.casefold())
+                # prefer assets mentioning our OS, and among those the ones that mention our machine
+                system, machine = platform.system().casefold(), platform.machine().casefold()
+                scores = []
+                for choice in asset_choices:
+                    name = choice.value.source.name.casefold()
+                    scores.append((system in name, machine in name))
+                best_score = max(scores)
+                preselected_assets = [c for c, score in zip(asset_choices, scores) if score == best_score]
                 if len(preselected_assets) <= 3 and len(preselected_assets) != len(asset_choices):
                     for c in preselected_assets:
                         c.checked = True
@@ -226,13 +227,13 @@ def add(url: str, detailed: bool = typer.Option(False, "-d", "--detailed",
                     asset.configure(install=config)
                     asset.install()
 
-            project_files = {f: FileType(f.path) for f in project.get_installed() if not f.external}
-            unconfigured = {f: t for (f, t) in project_files.items() if not f.asset}
+            project_files = [f for f in project.get_installed(include_unknown=True) if not f.external]
+            unconfigured = {f: FileType(f.path) for f in project_files if not f.asset}
             choices = [questionary.Choice(title=f"{f} ({t})", value=f, checked=t.executable) for (f, t) in unconfigured.items()]
             if choices:
                 selected = questionary.checkbox('Which of these additional files should be installed?', choices=choices).ask()
                 for file in selected:
-                    action = _configure_file(project, file.path, detailed)
+                    action = _configure_file(project, file.path, detailed, kind=unconfigured[file])
                     if action:
                         pattern = identifying_pattern(map(str, project_files), str(file),
                                                       version=release_record.version, avoid_minimal=True)
@@ -252,14 +253,20 @@ def _project_names():
     return list(edit_projects())
 
 @app.command()
-def update(projects: List[str] = typer.Argument(None, autocompletion=_project_names)):
+def update(projects: List[str] = typer.Argument(None, autocompletion=_project_names),
+           jobs: int = typer.Option(8, "-j", "--jobs", help="number of projects to update in parallel")):
     """Update project metadata."""
     updated = []
     if not projects:
-        projects = edit_projects()
-    for name in projects:
-        project = get_project(name, must_exist=True)
-        if project.update():
+        projects = list(edit_projects())
+    if not projects:
+        return updated
+    # updating is dominated by waiting for GitHub, so the projects are handled in parallel
+    results = run_parallel([get_project(name, must_exist=True) for name in projects], GitHubProject.update, jobs)
+    for project, needs_download, exception in results:
+        if exception is not None:
+            logger.error('Failed to update %s: %s', project, exception, exc_info=exception)
+        elif needs_download:
             updated.append(project)
             logger.info('%s can be upgraded', project)
     return updated
@@ -287,7 +294,7 @@ def install(projects: List[str] = typer.Argument(None, autocompletion=_project_n
             updated += 1
         do_upgrade = upgrade and project.needs_upgrade
         if reinstall or project.needs_install or do_upgrade:
-            if uninstall and project.get_installed():
+            if uninstall and project.get_installed(include_unknown=True):
                 project.uninstall()
                 uninstalled += 1
             project.install(force=reinstall)
@@ -314,6 +321,7 @@ def upgrade(projects: List[str] = typer.Argument(None, autocompletion=_project_n
 
 
 def _clear_display_names(table):
+    import tomlkit
     if hasattr(table, 'display_name'):
         table.display_name = None
     if isinstance(table, tomlkit.api.Container):
@@ -321,16 +329,12 @@ def _clear_display_names(table):
             _clear_display_names(v)
 
 
-class TOMLValidator(Validator):
-
-    def validate(self, document: Document):
-        try:
-            tomlkit.loads(document.text)
-        except tomlkit.exceptions.ParseError as e:
-            raise ValidationError(message=str(e), cursor_position=document.translate_row_col_to_index(e.line, e.col))
-
-
 def edit_project_config(project):
+    import questionary
+    import tomlkit
+    from prompt_toolkit.lexers import PygmentsLexer
+    from pygments.lexers.configs import TOMLLexer
+    from .validators import TOMLValidator
     config_str = tomlkit.dumps(project.config)
     new_config_str = questionary.text('Edit project config',
                                       default=config_str,
@@ -346,18 +350,28 @@ def edit_project_config(project):
 
 def _select_release(project, detailed):
     """Let the user select a release for the project. Configures the given project"""
-    special = dict(
-            latest=first((release for release in project.releases if
-                          not release.data['prerelease'] and not release.data['draft']), default=None),
-            pre=first((release for release in project.releases if not release.data['draft']), default=None))
+    import questionary
+    from .validators import FNMatchValidator
+    latest = pre = None
+    release_choices = []
+    releases_by_tag = {}
+    for release in project.releases:
+        if not release.data['draft']:
+            if pre is None:
+                pre = release
+            if latest is None and not release.data['prerelease']:
+                latest = release
+        release_choices.append(rel2choice(release))
+        releases_by_tag.setdefault(release['tag_name'], release)
+    special = dict(latest=latest, pre=pre)
     choices = []
     for label, release in special.items():
         if release:
             choices.append(rel2choice(release.data, label))
-    choices.extend(rel2choice(r) for r in project.releases)
+    choices.extend(release_choices)
     if 'release' in project.config:
         configured_release = project.config['release']
-        default_release_choice = first(c for c in choices if fnmatch.fnmatch(c.value, configured_release))
+        default_release_choice = first(c for c in choices if glob_match(c.value, configured_release))
     else:
         default_release_choice = None
     if not choices:
@@ -371,9 +385,9 @@ def _select_release(project, detailed):
         project.config['release'] = selected
         release_record = special[selected]
     else:
-        release_record = [p for p in project.releases if p['tag_name'] == selected][0]
+        release_record = releases_by_tag[selected]
         try:
-            pattern = identifying_pattern([r.data['tag_name'] for r in project.releases], selected)
+            pattern = identifying_pattern(list(releases_by_tag), selected)
             if detailed and '*' in pattern:
                 pattern = questionary.text(f'Release matching pattern',
                                            default=pattern,
@@ -385,14 +399,21 @@ def _select_release(project, detailed):
     return release_record
 
 
+_MAX_LISTED_FILES = 20
+
+
 def _remove_directory(directory: Path, force: bool):
+    import questionary
     if force:
         shutil.rmtree(directory)
     else:
-        files = list(directory.glob('**/*'))
+        # only list the first few files, a large leftover tree does not need to be walked completely
+        files = list(islice(directory.rglob('*'), _MAX_LISTED_FILES + 1))
         if files:
             console.print(f'{directory} still contains these files:')
-            console.print(*[f'• {f}' for f in files], sep='\n')
+            console.print(*[f'• {f}' for f in files[:_MAX_LISTED_FILES]], sep='\n')
+            if len(files) > _MAX_LISTED_FILES:
+                console.print('• …')
             if questionary.confirm(f'Should {directory} still be deleted?').ask():
                 shutil.rmtree(directory)
 
@@ -404,6 +425,9 @@ def uninstall(projects: List[str] = typer.Argument(None, autocompletion=_project
               remove_status: bool = typer.Option(False, '-s', '--status',  help=f"Also remove {APP_NAME}'s state info for the project"),
               remove_directory: bool = typer.Option(False, '-d', '--directory',  help="Also remove everything within the project directory"),
               yes: bool = typer.Option(False, '-y', '--yes',  help="Assume Yes as answer to all questions")):
+    import questionary
+    import tomlkit
+    from rich.syntax import Syntax
     with edit_projects() as settings:
         if all and not projects:
             projects = settings.keys()
@@ -450,7 +474,7 @@ def file_table(project: GitHubProject, include_type=False, **kwargs):
     table.add_column('External?', style='red')
     if include_type:
         table.add_column('File Type')
-    for file in project.get_installed():
+    for file in project.get_installed(include_unknown=True):
         cells = [str(file),
                  str(file.install_spec) if file.install_spec else '',
                  'A' if file.asset else '',
@@ -500,6 +524,7 @@ def ls(projects: List[str] = typer.Argument(None, autocompletion=_project_names)
     if show_details:
         table.add_column('Details')
 
+    now = datetime.now()
     with Live(table, console=console):
         for project in projects:
             current_project = get_project(project)
@@ -520,21 +545,18 @@ def ls(projects: List[str] = typer.Argument(None, autocompletion=_project_names)
                 text.stylize('bold', len(text) - len(path.name))
                 return text
 
-            def attr(file: ProjectFile) -> Text:
+            def attr(file: ProjectFile, stat: os.stat_result, is_link: bool, broken_link: bool) -> Text:
+                """stat is the stat of the file, or of the link target for working links"""
                 result = Text()
                 na = Text('-', '#404040')
-                is_link = file.path.is_symlink()
-                try:
-                    stat = file.path.stat()
-                    link_flag = Text('∞', 'light_blue') if is_link else na
-                except FileNotFoundError as e:
+                if broken_link:
                     link_flag = Text('!', 'bold red')
-                    logger.debug(e)
-                    stat = file.path.stat(follow_symlinks=False)
+                else:
+                    link_flag = Text('∞', 'light_blue') if is_link else na
                 result += Text('A', 'cyan') if file.asset else na
                 result += Text('X', 'magenta') if file.external else na
                 result += Text('x', 'yellow') if stat.st_mode & 0o111 else na
-                result += Text('d', 'green') if file.path.is_dir() else na
+                result += Text('d', 'green') if S_ISDIR(stat.st_mode) else na
                 result += link_flag
                 result += Text('?', 'blue') if file.unregistered else na
                 return result
@@ -549,15 +571,23 @@ def ls(projects: List[str] = typer.Argument(None, autocompletion=_project_names)
 
             for file, tree_line in zip(selected, lines):
                 stat = file.path.lstat()
+                is_link = S_ISLNK(stat.st_mode)
+                target_stat, broken_link = stat, False
+                if is_link:
+                    try:
+                        target_stat = file.path.stat()
+                    except FileNotFoundError as e:
+                        broken_link = True
+                        logger.debug(e)
                 cells = [
                     tree_line,
-                    attr(file),
+                    attr(file, target_stat, is_link, broken_link),
                     styled_nsize(stat.st_size),
-                    styled_ntime(datetime.fromtimestamp(stat.st_mtime))]
+                    styled_ntime(datetime.fromtimestamp(stat.st_mtime), now)]
                 if show_details:
                     cells.append(Text(str(file.install_spec), style='green') if file.install_spec
                                  else Text('⏵' + current_project.project_relative_fspath(file.path.readlink()),
-                                           style='cyan') if file.path.is_symlink()
+                                           style='cyan') if is_link
                                  else '')
                 if not single_project:
                     cells.insert(0, '' if shown_project_name else Text(str(current_project), 'bright_cyan on black'))
@@ -568,9 +598,11 @@ def styled_nsize(size: int) -> Text:
     return Text(humanize.naturalsize(size),
                 "bold" if size >= 2 ** 20 else "dim" if size < 2 ** 10 else "")
 
-def styled_ntime(time: datetime) -> Text:
-    delta = datetime.now() - time
-    return Text(humanize.naturaltime(time),
+def styled_ntime(time: datetime, now: Optional[datetime] = None) -> Text:
+    if now is None:
+        now = datetime.now()
+    delta = now - time
+    return Text(humanize.naturaltime(time, when=now),
                 "bold" if delta.days < 14 else "dim" if delta.days > 365 else "")
 
 
@@ -583,6 +615,8 @@ def status(projects: List[str] = typer.Argument(None, help="Projects to show (om
     """
     List the configured projects and their state.
     """
+    import tomlkit
+    from rich.syntax import Syntax
     all_projects = edit_projects()
     update_list = []
     upgrade_list = []
@@ -685,8 +719,8 @@ def pd(project_name: str = typer.Argument(..., autocompletion=_project_names),
         if not command:
             console.print(os.fspath(project.directory))
         else:
-                with project.use_directory():
-                    result = subprocess.run(command)
+                with project.use_directory() as project_dir:
+                    result = subprocess.run(command, cwd=project_dir)
                     sys.exit(result.returncode)
     except Exception as e:
         logger.error('Failed to run command %s for project %s: %s', ' '.join(command) or 'pd', project_name, e)
@@ -703,6 +737,9 @@ def clean(yes: bool = typer.Option(False, "-y", "--yes", help="Answer Yes to all
     """
     Remove broken configuration or files.
     """
+    import questionary
+    import tomlkit
+    from rich.syntax import Syntax
 
     project_count = 0
     valid_projects = 0
@@ -829,7 +866,7 @@ class NoPatternError(ValueError):
     ...
 
 
-def identifying_pattern(alternatives: List[str], selection: str, version: Optional[str] = None, avoid_minimal=False) -> str:
+def identifying_pattern(alternatives: Iterable[str], selection: str, version: Optional[str] = None, avoid_minimal=False) -> str:
     """
     Given a selection string and a set of alternatives, this function returns a version of selection 
     that replaces all substrings common to all the selection and all alternatives with a '*'. E.g.,
@@ -837,17 +874,36 @@ def identifying_pattern(alternatives: List[str], selection: str, version: Option
     >>> identifying_pattern(['foo-windows.tar.gz', 'foo-macos.tar.gz'],'foo-linux.tar.gz')
     '*linux*'
     """
-    if selection in alternatives:
-        alternatives = [a for a in alternatives if selection != a]
+    result = _identifying_pattern(tuple(sorted(alternatives)), selection, version, avoid_minimal)
+    if isinstance(result, NoPatternError):
+        raise NoPatternError(*result.args)
+    return result
+
+
+@lru_cache(maxsize=128)
+def _identifying_pattern(alternatives: Tuple[str, ...], selection: str, version: Optional[str],
+                         avoid_minimal: bool) -> Union[str, NoPatternError]:
+    """
+    Memoized implementation of identifying_pattern, returns a NoPatternError instead of raising it.
+    """
+    try:
+        return _find_identifying_pattern(list(alternatives), selection, version, avoid_minimal)
+    except NoPatternError as e:
+        return e
+
+
+def _find_identifying_pattern(alternatives: List[str], selection: str, version: Optional[str],
+                              avoid_minimal: bool) -> str:
+    alternatives = [a for a in alternatives if a != selection]
 
     def check_pattern(pattern, exception=True):
         """
         A pattern is valid if it matches the selection but not any of the alternatives.
         """
         try:
-            if not fnmatch.fnmatch(selection, pattern):
+            if not glob_match(selection, pattern):
                 raise NoPatternError(f'Could not generate a match pattern. The candidate, "{pattern}", does not match "{selection}".')
-            matching_alternatives = fnmatch.filter(alternatives, pattern)
+            matching_alternatives = glob_filter(alternatives, pattern)
             if matching_alternatives:
                 raise NoPatternError(f'Could not generate a match pattern. The candidate, "{pattern}", matches {len(matching_alternatives)} alternatives: {matching_alternatives}')
             logger.debug('Pattern %s for selection %s, alternatives %s', pattern, selection, alternatives)
@@ -889,21 +945,43 @@ def identifying_pattern(alternatives: List[str], selection: str, version: Option
                 result += '*'
             return result
 
+    # typical case: all names share a prefix and a suffix, and only the middle part identifies the selection.
+    # Digits in the middle are probably a version number, which the general algorithm masks.
+    if alternatives:
+        prefix_len = len(os.path.commonprefix([selection] + alternatives))
+        suffix_len = min(len(os.path.commonprefix([selection[::-1]] + [a[::-1] for a in alternatives])),
+                         len(selection) - prefix_len)
+        middle = selection[prefix_len:len(selection) - suffix_len]
+        if middle and not any(char.isdigit() for char in middle):
+            pattern = ('*' if prefix_len else '') + middle + ('*' if suffix_len else '')
+            if check_pattern(pattern, exception=False):
+                return pattern
+
     # collect common substrings (or rather, character indexes)
-    common_idx = set(range(len(selection)))
+    common_mask = (1 << len(selection)) - 1  # bit i is set if selection[i] is common to all alternatives
+    selection_chars = set(selection)
     for alternative in alternatives:
+        if not common_mask:
+            break
+        if selection_chars.isdisjoint(alternative):
+            common_mask = 0
+            break
         matcher = SequenceMatcher(a=selection, b=alternative)
-        matching_idx = set(chain.from_iterable(range(m.a, m.a+m.size) for m in matcher.get_matching_blocks()))        
-        common_idx &= matching_idx        
-    
+        matching_mask = 0
+        for m in matcher.get_matching_blocks():
+            matching_mask |= ((1 << m.size) - 1) << m.a
+        common_mask &= matching_mask
+
     # create pattern from that
-    pattern_parts =  []
-    for i in range(len(selection)):
-        if i in common_idx:
-            if i-1 not in common_idx:
-                pattern_parts.append('*')
-        else:
-            pattern_parts.append(selection[i])
+    pattern_parts = []
+    previous_common = False
+    for i, char in enumerate(selection):
+        common = (common_mask >> i) & 1
+        if not common:
+            pattern_parts.append(char)
+        elif not previous_common:
+            pattern_parts.append('*')
+        previous_common = common
     pattern = ''.join(pattern_parts)
     
     # assert correctness
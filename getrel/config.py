@@ -2,23 +2,26 @@ import typing
 from abc import ABC, abstractmethod
 from collections.abc import Mapping, MutableMapping
 from datetime import timedelta
-from difflib import unified_diff
 from operator import getitem
 from pathlib import Path
 from typing import Optional, TypeVar, Union
-from contextlib import contextmanager
-from functools import lru_cache
-from unittest.mock import MagicMock
-
-from durations import Duration
-from tomlkit.toml_document import TOMLDocument
+from functools import lru_cache, wraps
 import json
 import os
-
-import xdg
-import tomlkit
+import re
+import shutil
+import threading
 
 import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if typing.TYPE_CHECKING:
+    from tomlkit.toml_document import TOMLDocument
+
 logger = logging.getLogger(__name__)
 
 APP_NAME = 'getrel'
@@ -31,6 +34,24 @@ APP_NAME = 'getrel'
 
 console = None
 
+_MAX_DIFF_SIZE = 32 * 1024  # larger files are not diffed for the debug log
+_save_lock = threading.Lock()
+
+
+class _LazyDiff:
+    """
+    Unified diff between two strings that is only computed when formatted, e.g. by a log handler.
+    """
+
+    def __init__(self, old: str, new: str):
+        self.old = old
+        self.new = new
+
+    def __str__(self):
+        from difflib import unified_diff
+        return ''.join(unified_diff(self.old.splitlines(keepends=True), self.new.splitlines(keepends=True)))
+
+
 class BaseSettings(ABC, MutableMapping):
     """
     Thin wrapper around a structured document that keeps track of the file to load and save to.
@@ -43,6 +64,10 @@ class BaseSettings(ABC, MutableMapping):
     When used as a context manager, the settings file will be saved automatically upon
     successfully leaving the `with` block.
 
+    Saving is skipped when the settings are not dirty, i.e. nothing has been assigned or deleted
+    and no nested container has been handed out via item access since the last load or save.
+    If you modify settings.data directly, use ``save(force=True)``.
+
     This is the abstract base class. For support for a specific file format, subclass 
     and implement the three static methods dumps() to serialize data, loads() to de serialize
     data and new_data() to create a new settings record.
@@ -55,6 +80,8 @@ class BaseSettings(ABC, MutableMapping):
     store: Path
     data: MutableMapping
     last_state: Optional[str]
+    mtime_ns: Optional[int] = None
+    _dirty: bool = False
 
     @staticmethod
     @abstractmethod
@@ -74,30 +101,71 @@ class BaseSettings(ABC, MutableMapping):
     def load(self, file: Optional[Path] = None):
         if file is None:
             file = self.store
-        with file.open('rt', encoding='utf-8') as f:
-            self.data = self.loads(f.read())
-        self.last_state = self.dumps(self.data)
+        mtime_ns = file.stat().st_mtime_ns
+        content = file.read_text(encoding='utf-8')
+        self.data = self.loads(content)
+        self.last_state = content
+        self._dirty = False
+        if file == self.store:
+            self.mtime_ns = mtime_ns
         return self.data
 
+    def reload_if_modified(self) -> bool:
+        """
+        Reloads the data if the store has been modified by someone else since we loaded or saved it.
+
+        Unsaved changes are never discarded, i.e. dirty settings are not reloaded.
+
+        Returns:
+            True if the data has been reloaded.
+        """
+        try:
+            mtime_ns = self.store.stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime_ns != self.mtime_ns and not self._dirty:
+            logger.debug('%s has been modified, reloading', self.store)
+            self.load()
+            return True
+        return False
+
     def save(self, file: Optional[Path] = None, force: bool = False):
         """
         Serializes the data and stores it to the given file, or to self.store. 
-        Parent directories are created as needed, the file is overwritten if it
-        exists.
+        Parent directories are created as needed, the file is atomically replaced
+        if it exists.
         """
-        new_content = self.dumps(self.data)
-        if force or new_content != self.last_state:
-            assert isinstance(self.loads(new_content), Mapping)
-            if file is None:
-                file = self.store
-            file.parent.mkdir(parents=True, exist_ok=True)
-            file.write_text(new_content)
-            if logger.isEnabledFor(logging.DEBUG):
-                if self.last_state:
-                    logger.debug('Saved %s, diff: %s', self.store, '\n'.join(unified_diff(self.last_state.split('\n'), new_content.split('\n'))))
-                else:
-                    logger.debug('Created %s, content: %s', self.store, new_content)
-            self.last_state = new_content
+        if not (force or self._dirty):
+            return
+        with _save_lock:  # settings may be saved from several worker threads
+            new_content = self.dumps(self.data)
+            if force or new_content != self.last_state:
+                if file is None:
+                    file = self.store
+                is_store = file == self.store
+                file = file.resolve()  # replace the target of a symlink, e.g. into a dotfiles repository
+                file.parent.mkdir(parents=True, exist_ok=True)
+                # write to a temporary file first so readers never see a partially written file
+                tmp_file = file.with_name(file.name + '.tmp')
+                with tmp_file.open('wt', encoding='utf-8') as f:
+                    f.write(new_content)
+                    f.flush()
+                    os.fsync(f.fileno())
+                if file.exists():
+                    shutil.copymode(file, tmp_file)
+                os.replace(tmp_file, file)
+                if is_store:
+                    self.mtime_ns = file.stat().st_mtime_ns
+                if logger.isEnabledFor(logging.DEBUG):
+                    assert isinstance(self.loads(new_content), Mapping)
+                    if self.last_state and max(len(self.last_state), len(new_content)) > _MAX_DIFF_SIZE:
+                        logger.debug('Saved %s (%d -> %d characters)', self.store, len(self.last_state), len(new_content))
+                    elif self.last_state:
+                        logger.debug('Saved %s, diff:\n%s', self.store, _LazyDiff(self.last_state, new_content))
+                    else:
+                        logger.debug('Created %s, content: %s', self.store, new_content)
+                self.last_state = new_content
+            self._dirty = False
 
     def __init__(self, file: Union[Path, str], data: Optional[Mapping] = None, save_on_error=True) -> None:
         """
@@ -110,19 +178,26 @@ class BaseSettings(ABC, MutableMapping):
         if both file and data exist, the file is read and the resulting mapping
         updated using the data from the argument.
         """
+        self._dirty = False
         self.last_state = None
         self.save_on_error = save_on_error
         if isinstance(file, str):
             file = Path(file)
         self.store = file
-        try:
-            self.load()
-        except Exception as e:
+        if file.exists():
+            try:
+                self.load()
+            except Exception as e:
+                self.data = self.new_data()
+                self._dirty = True
+                logger.debug('Could not load %s: %s. Using new data.', file, e, exc_info=True)
+        else:
             self.data = self.new_data()
-            logger.debug('Could not load %s: %s. Using new data.', file, e, exc_info=True)
+            self._dirty = True
 
         if data is not None:
             self.data.update(data)
+            self._dirty = True
 
     def __enter__(self):
         return self
@@ -132,16 +207,48 @@ class BaseSettings(ABC, MutableMapping):
             self.save()
 
     def __getattr__(self, name):
+        # delegated methods may modify the data
+        self._dirty = True
         return getattr(self.data, name)
 
     def __getitem__(self, item):
-        return self.data[item]
+        value = self.data[item]
+        if isinstance(value, (MutableMapping, list)):
+            # the caller may modify nested data we cannot track
+            self._dirty = True
+        return value
 
     def __setitem__(self, item, value):
         self.data[item] = value
+        self._dirty = True
 
     def __delitem__(self, item):
         del self.data[item]
+        self._dirty = True
+
+    # The following delegate directly to the data instead of going through the generic
+    # MutableMapping implementations, which call __getitem__ etc. for each access
+
+    def __contains__(self, item):
+        return item in self.data
+
+    def get(self, item, default=None):
+        value = self.data.get(item, default)
+        if isinstance(value, (MutableMapping, list)):
+            self._dirty = True
+        return value
+
+    def setdefault(self, item, default=None):
+        self._dirty = True
+        return self.data.setdefault(item, default)
+
+    def pop(self, item, *default):
+        self._dirty = True
+        return self.data.pop(item, *default)
+
+    def update(self, *args, **kwargs):
+        self._dirty = True
+        self.data.update(*args, **kwargs)
 
     def __iter__(self):
         return iter(self.data)
@@ -154,18 +261,57 @@ class BaseSettings(ABC, MutableMapping):
 
 
 class Settings(BaseSettings):
-    data: TOMLDocument
+    """
+    TOML settings that are mainly read.
+
+    The file is parsed using the fast tomllib (or tomli) parser to a plain dict and written using
+    tomli_w, if available. Comments and formatting are lost when the settings are saved. Use
+    TomlKitSettings for files the user edits.
+    """
+
+    @staticmethod
+    def dumps(data) -> str:
+        try:
+            import tomli_w
+        except ImportError:
+            return TomlKitSettings.dumps(data)
+        return tomli_w.dumps(data)
+
+    @staticmethod
+    def loads(str):
+        try:
+            import tomllib
+        except ImportError:  # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                return TomlKitSettings.loads(str)
+        return tomllib.loads(str)
+
+    @staticmethod
+    def new_data():
+        return dict()
+
+
+class TomlKitSettings(Settings):
+    """
+    TOML settings that preserve comments and formatting when modified and saved.
+    """
+    data: 'TOMLDocument'
 
     @staticmethod
     def dumps(data) -> str:
+        import tomlkit
         return tomlkit.dumps(data)
 
     @staticmethod
     def loads(str):
+        import tomlkit
         return tomlkit.loads(str)
 
     @staticmethod
     def new_data():
+        import tomlkit
         return tomlkit.document()
 
 
@@ -173,10 +319,14 @@ class JSONSettings(BaseSettings):
 
     @staticmethod
     def dumps(data: MutableMapping) -> str:
+        if orjson is not None:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode('utf-8')
         return json.dumps(data, indent=2)
 
     @staticmethod
     def loads(data):
+        if orjson is not None:
+            return orjson.loads(data)
         return json.loads(data)
 
     @staticmethod
@@ -184,13 +334,48 @@ class JSONSettings(BaseSettings):
         return dict()
 
 
+def _reload_if_modified(factory):
+    """
+    Decorator for functions returning a settings object: The result is cached like with lru_cache,
+    but reloaded from disk if the underlying file has been modified in the meantime.
+    """
+    cached_factory = lru_cache()(factory)
+
+    @wraps(factory)
+    def wrapper(*args, **kwargs):
+        settings = cached_factory(*args, **kwargs)
+        settings.reload_if_modified()
+        return settings
+
+    wrapper.cache_clear = cached_factory.cache_clear
+    return wrapper
+
+
 @lru_cache()
-def edit_projects() -> Settings:
-    return Settings(xdg.xdg_config_home() / APP_NAME / 'projects.toml')
+def config_home() -> Path:
+    """
+    Returns getrel's configuration directory, usually ~/.config/getrel.
+    """
+    import xdg
+    return xdg.xdg_config_home() / APP_NAME
+
+
+@lru_cache()
+def data_home() -> Path:
+    """
+    Returns the directory containing the project directories, usually ~/.local/share/getrel.
+    """
+    import xdg
+    return xdg.xdg_data_home() / APP_NAME
+
+
+@_reload_if_modified
+def edit_projects() -> TomlKitSettings:
+    return TomlKitSettings(config_home() / 'projects.toml')
 
 
 def project_directory(project_name: Optional[str] = None) -> Path:
-    root = xdg.xdg_data_home() / APP_NAME
+    root = data_home()
     if project_name:
         return root / project_name
     else:
@@ -206,12 +391,9 @@ def project_state_directory(project_name: str, create=False) -> Path:
 
 def verb_or_spec(value: Union[str, Mapping, None], allowed_verbs=None):
     if isinstance(value, Mapping):
-        items = value.items()
-        if len(items) == 0:
-            verb, arg = None, None
-        elif len(items) == 1:
-            verb, arg = next(iter(items))
-        else:
+        items = iter(value.items())
+        verb, arg = next(items, (None, None))
+        if next(items, None) is not None:
             raise TypeError("More than one key-value pair is not allowed here")
     else:
         verb, arg = value, None
@@ -246,6 +428,7 @@ class SettingAttribute:
         self.dtype = dtype
         self.name = name
         self.default = default
+        self._has_default = default is not self._no_default
         self.autosave = autosave
 
         if parse is not None:
@@ -254,27 +437,41 @@ class SettingAttribute:
             self.parse = dtype
         else:
             self.parse = lambda x: x
+        self._parse_identity = parse is None and dtype is None
 
         if unparse is not None:
             self.unparse = unparse
         else:
             self.unparse = lambda x: x
+        self._unparse_identity = unparse is None
 
     def __get__(self, obj: BaseSettings, objtype=None) -> T:
         try:
-            return self.parse(obj[self.name])
+            value = obj[self.name]
         except KeyError:
-            if self.default is self._no_default:
-                raise
-            else:
+            if self._has_default:
                 return self.default
+            raise
+        if self._parse_identity:
+            return value
+        cache = obj.__dict__.setdefault('_setting_attribute_cache', {})
+        if self.name in cache:
+            raw, parsed = cache[self.name]
+            if raw == value:
+                return parsed
+        parsed = self.parse(value)
+        cache[self.name] = value, parsed
+        return parsed
 
     def __set__(self, obj: BaseSettings, value: T):
-        obj[self.name] = self.unparse(value)
+        obj[self.name] = value if self._unparse_identity else self.unparse(value)
+        obj.__dict__.get('_setting_attribute_cache', {}).pop(self.name, None)
         if self.autosave:
             obj.save()
 
+@lru_cache(maxsize=64)
 def _parse_duration(s: str) -> timedelta:
+    from durations import Duration
     return timedelta(seconds=Duration(str(s)).to_seconds())
 
 def _unparse_duration(d: timedelta) -> str:
@@ -284,48 +481,110 @@ class _ProgramSettings(Settings):
     fetch_delay = SettingAttribute('fetch_delay', default=timedelta(days=1), dtype=timedelta, parse=_parse_duration, unparse=_unparse_duration)
     update_delay = SettingAttribute('update_delay', default=timedelta(days=1), dtype=timedelta, parse=_parse_duration, unparse=_unparse_duration)
 
-settings = _ProgramSettings(xdg.xdg_config_home() / APP_NAME / 'settings.toml')
+_settings: Optional[_ProgramSettings] = None
+
+def __getattr__(name):
+    # settings are loaded on first access only, `import getrel.config` should not parse a file
+    global _settings
+    if name == 'settings':
+        if _settings is None:
+            _settings = _ProgramSettings(config_home() / 'settings.toml')
+        return _settings
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
 def expand_path(path: Union[str, os.PathLike], project_name=None, **kwargs) -> Path:
-    if project_name:
-        kwargs['PROJECT'] = project_name
-        kwargs['PROJECT_DIR'] = project_directory(project_name)
-    with update_environ(kwargs):
-        return Path(os.path.expandvars(os.path.expanduser(path)))
+    return _expand_path_cached(os.fspath(path), project_name,
+                               tuple(sorted((str(k), str(v)) for k, v in kwargs.items())))
 
 
-@contextmanager
-def update_environ(extra_env):
-    backup = dict(os.environ)
-    os.environ.update({str(k): str(v) for k, v in extra_env.items()})
-    yield os.environ
-    os.environ.update(backup)
-    for key in set(os.environ) - set(backup):
-        del os.environ[key]
+_VARIABLE = re.compile(r'\$(\w+|\{[^}]*\})', re.ASCII)
 
+@lru_cache(maxsize=512)
+def _expand_path_cached(path: str, project_name: Optional[str], items: typing.Tuple[typing.Tuple[str, str], ...]) -> Path:
+    variables = dict(items)
+    if project_name:
+        variables['PROJECT'] = project_name
+        variables['PROJECT_DIR'] = os.fspath(project_directory(project_name))
+    return Path(_expandvars(os.path.expanduser(path), variables))
 
-@lru_cache()
+
+def _expandvars(path: str, variables: Mapping[str, str]) -> str:
+    """
+    Like os.path.expandvars, but looks up variables in the given mapping before
+    the environment. Unknown variables are left unchanged.
+    """
+    def replace(match):
+        name = match.group(1)
+        if name.startswith('{'):
+            name = name[1:-1]
+        if name in variables:
+            return variables[name]
+        return os.environ.get(name, match.group(0))
+    if '$' not in path:
+        return path
+    return _VARIABLE.sub(replace, path)
+
+
+@_reload_if_modified
 def edit_project_state(project_name: str) -> BaseSettings:
     return JSONSettings(project_state_directory(project_name) / 'state.json')
 
+@lru_cache(maxsize=None)
+def _rich_progress():
+    from rich import progress
+    return progress
+
+
+def _progress_columns(progress) -> tuple:
+    # rich's columns cache renderables per task id, so each Progress needs its own instances
+    return (progress.TextColumn("[bold blue]{task.description}", justify="right"),
+            progress.BarColumn(bar_width=None),
+            "[progress.percentage]{task.percentage:>3.1f}%",
+            "•",
+            progress.DownloadColumn(),
+            "•",
+            progress.TransferSpeedColumn(),
+            "•",
+            progress.TimeRemainingColumn())
+
+
+class _NoProgress:
+    """
+    Stand-in for rich.progress.Progress if rich is not available. Does nothing.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        pass
+
+    def add_task(self, description, *args, **kwargs) -> int:
+        return 0
+
+    def start_task(self, task_id):
+        pass
+
+    def stop_task(self, task_id):
+        pass
+
+    def update(self, task_id, **kwargs):
+        pass
+
+    def advance(self, task_id, advance=1):
+        pass
+
+
+_no_progress = _NoProgress()
+
+
 def get_progress(**kwargs):
+    if threading.current_thread() is not threading.main_thread():
+        return _no_progress  # rich supports only one live display at a time
     try:
-        from rich.progress import Progress, TextColumn, BarColumn, DownloadColumn, TransferSpeedColumn, TimeRemainingColumn
-        if console and not 'console' in kwargs:
-            kwargs['console'] = console
-
-        return Progress(
-                TextColumn("[bold blue]{task.description}", justify="right"),
-                BarColumn(bar_width=None),
-                "[progress.percentage]{task.percentage:>3.1f}%",
-                "•",
-                DownloadColumn(),
-                "•",
-                TransferSpeedColumn(),
-                "•",
-                TimeRemainingColumn(),
-                **kwargs
-        )
+        progress = _rich_progress()
     except ImportError:
-        from unittest.mock import Mock
-        return MagicMock()
+        return _no_progress
+    if console:
+        kwargs.setdefault('console', console)
+    return progress.Progress(*_progress_columns(progress), **kwargs)
@@ -1,29 +1,30 @@
 from collections.abc import Mapping, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from copy import deepcopy
 from datetime import datetime
-from functools import lru_cache
-from glob import glob
-from operator import itemgetter
-from os import environ, fspath, chdir
+from operator import attrgetter, itemgetter
+import os
+from os import environ, fspath, lstat, scandir, sep, stat
+from os.path import isabs, join, normcase, normpath
 import re
-from fnmatch import fnmatch
 from functools import total_ordering
 import zipfile
 import tarfile
+from time import time_ns
+from stat import S_ISDIR
 
-from typing import Optional, Any, Union, List, Tuple
-
-import dateutil
-import tomlkit
-from dateutil.parser import isoparse
+from typing import Optional, Any, Union, List, Tuple, Collection, Dict, Iterator, Set, Callable, Iterable, TypeVar
 
 from .config import BaseSettings
 from . import config
-from .utils import naturalsize, first, fetch_if_newer
+from .utils import naturalsize, first, fetch_if_newer, glob_match, compile_glob
 import logging
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar('T')
+
 try:
     import pathlib2 as pathlib
     logger.debug('Imported pathlib2')
@@ -45,6 +46,151 @@ if not hasattr(Path, 'is_relative_to'):
 
 
 
+def _scan_files(directory: Union[Path, str], prefix: str = '', exclude: Collection[str] = ()) -> Iterator[str]:
+    """
+    Recursively lists the files below directory, as paths relative to directory.
+
+    Like directory.rglob('*') without the directories, but the file types are taken from the directory
+    listing, which saves a stat() call per file. Symbolic links to directories are neither listed nor
+    followed. Relative paths in exclude are skipped.
+    """
+    with scandir(directory) as entries:
+        for entry in entries:
+            rel_path = prefix + entry.name
+            if rel_path in exclude:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_files(entry.path, rel_path + sep, exclude)
+            elif not entry.is_dir():
+                yield rel_path
+
+
+def _snapshot_tree(directory: str, ignore: Collection[str] = ()) -> Dict[str, Tuple[int, List[str], List[str]]]:
+    """
+    Records the directory tree below directory for a later call to _new_paths.
+
+    Subdirectories whose name is in ignore are listed, but not descended into.
+
+    Returns:
+        a mapping from each directory path to its mtime, its entry names and the paths of its subdirectories
+    """
+    snapshot = {}
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            mtime = stat(current).st_mtime_ns  # before listing, so that concurrent changes will show up later
+            names, subdirs = [], []
+            with scandir(current) as entries:
+                for entry in entries:
+                    names.append(entry.name)
+                    if entry.is_dir(follow_symlinks=False) and entry.name not in ignore:
+                        subdirs.append(entry.path)
+        except OSError:
+            continue
+        snapshot[current] = (mtime, names, subdirs)
+        pending.extend(subdirs)
+    return snapshot
+
+
+def _new_paths(directory: str, snapshot: Mapping[str, Tuple[int, List[str], List[str]]], since_ns: int,
+               ignore: Collection[str] = ()) -> List[str]:
+    """
+    Lists the paths below directory that are not in the snapshot taken at since_ns by _snapshot_tree.
+
+    Existing subdirectories whose name is in ignore are skipped, new ones are listed completely.
+
+    Creating an entry updates the mtime of its directory, so directories with an unchanged mtime are
+    not listed again. Directories modified shortly before the snapshot are always listed, since a
+    change in the same timestamp tick would not change their mtime.
+    """
+    racy_ns = since_ns - 1_000_000_000
+    new_paths = []
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        old = snapshot.get(current)
+        try:
+            if old is not None:
+                mtime = stat(current).st_mtime_ns
+                if mtime == old[0] and mtime < racy_ns:
+                    pending.extend(old[2])
+                    continue
+            old_names = set(old[1]) if old is not None else set()
+            with scandir(current) as entries:
+                for entry in entries:
+                    if entry.name not in old_names:
+                        new_paths.append(entry.path)
+                    elif entry.name in ignore:
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+        except OSError:
+            continue
+    return new_paths
+
+
+_EXEC_SCRIPT_IGNORE = ('.git', '.venv', '__pycache__', 'node_modules')
+_GLOB_MAGIC = re.compile('[*?[]')
+_HTTP_URL = re.compile(r'https?://')
+_GITHUB_URL = re.compile(r'https?://(?:[^/]+\.)?github\.com/([^/?\s]+)/([^/?\s]+)')
+_USER_REPO = re.compile(r'([^/\s]+)/([^/\s]+)')
+
+
+def _glob(directory: Path, pattern: Path) -> List[Path]:
+    """
+    Returns the paths matching the glob pattern. Relative patterns are relative to directory.
+
+    The leading path segments that do not contain wildcards are joined to the directory before
+    globbing, so only the subtree that can actually match is scanned.
+    """
+    if pattern.is_absolute():
+        base, parts = Path(pattern.anchor), pattern.parts[1:]
+    else:
+        base, parts = directory, pattern.parts
+    literal_count = 0
+    for part in parts:
+        if _GLOB_MAGIC.search(part):
+            break
+        literal_count += 1
+    base = base.joinpath(*parts[:literal_count])
+    rest = parts[literal_count:]
+    if not rest:
+        return [base] if base.exists() or base.is_symlink() else []
+    return list(base.glob(fspath(Path(*rest))))
+
+
+def _deepest_first(items, path=None) -> list:
+    """
+    Returns the items sorted such that deeper paths come before their parents.
+
+    The depth is the number of path separators, computed once per item; path optionally extracts the
+    path from an item.
+    """
+    keyed = [(fspath(path(item) if path else item).count(sep), item) for item in items]
+    keyed.sort(key=itemgetter(0), reverse=True)
+    return [item for _, item in keyed]
+
+
+def _merge_into(target: MutableMapping, source: Mapping):
+    """
+    Updates target in place to be equal to source, touching only the keys that differ.
+
+    Nested tables are merged recursively instead of being replaced, so the formatting of a tomlkit
+    document is kept for everything that has not changed.
+    """
+    for key in [key for key in target if key not in source]:
+        del target[key]
+    for key, value in source.items():
+        if key not in target:
+            target[key] = value
+        elif isinstance(value, Mapping) and isinstance(target[key], MutableMapping):
+            if target[key] != value:
+                _merge_into(target[key], value)
+        elif target[key] != value:
+            target[key] = value
+
+
 @total_ordering
 class Release(Mapping):
     version: str
@@ -55,6 +201,7 @@ class Release(Mapping):
         self.version = version
         self.date = date
         self.data = data or {}
+        self._version_key = tuple(version.split()) if version else ()
 
     def __str__(self):
         return self.version
@@ -75,7 +222,7 @@ class Release(Mapping):
         if self.date and other.date:
             return self.date < other.date
         else:
-            return self.version.split() < other.version.split()
+            return self._version_key < other._version_key
 
     def __eq__(self, other: 'Release'):
         if isinstance(other, Release):
@@ -99,6 +246,7 @@ class Release(Mapping):
     @classmethod
     def fromdict(cls, src):
         if isinstance(src, Mapping):
+            from dateutil.parser import isoparse
             version = src['version']
             date = isoparse(src['date'])
         else:
@@ -119,27 +267,31 @@ class ProjectFile:
     external: bool = False
     boring: bool = False
 
-    def __init__(self, project: "GitHubProject", file: Union[Path, str], unregistered=False):
+    def __init__(self, project: "GitHubProject", file: Union[Path, str], unregistered=False,
+                 assets: Optional["Mapping[Path, GithubAsset]"] = None):
+        """
+        Args:
+            project: the project the file belongs to
+            file: path to the file, relative to the project directory or absolute
+            unregistered: True if the file has not been registered as installed by the project
+            assets: the project's assets by absolute source path, as returned by project.assets_by_source().
+                    Pass this when creating many project files, otherwise it is computed for each file.
+        """
         self.project = project
         self.path = project.resolve_path(file)
         self.unregistered = unregistered
-        self.external = not self.path.is_relative_to(project.directory)
+        rel_path = project.project_relative_fspath(file)
+        self.external = isabs(rel_path)  # project_relative_fspath returns an absolute path for outside files
 
-        for asset in project.get_assets():
-            try:
-                if self.path.absolute() == asset.source.absolute():
-                    self.asset = asset
-                    break
-            except OSError:
-                if self.path == asset.source:
-                    self.asset = asset
-                    break
+        if assets is None:
+            assets = project.assets_by_source()
+        self.asset = assets.get(self.path)
 
         if self.asset and self.asset.install_spec:
             self.install_spec = self.asset.install_spec
         elif not self.external and 'install' in project.config:
             for pattern, action in project.config['install'].items():
-                if fnmatch(project.project_relative_fspath(self.path), pattern):
+                if glob_match(rel_path, pattern):
                     self.install_spec = action
                     break
 
@@ -158,9 +310,21 @@ class ProjectFile:
 class GitHubRelease(Release):
     def __init__(self, release_record: Mapping):
         super().__init__(version=release_record['tag_name'],
-                         date=isoparse(release_record['published_at']),
+                         date=None,
                          data=release_record)
 
+    @property
+    def date(self) -> Optional[datetime]:
+        # parsed on first access only, most releases are never compared by date
+        if self._date is None and self.data.get('published_at'):
+            from dateutil.parser import isoparse
+            self._date = isoparse(self.data['published_at'])
+        return self._date
+
+    @date.setter
+    def date(self, value: Optional[datetime]):
+        self._date = value
+
 
 class Installable:
     """
@@ -211,7 +375,7 @@ class Installable:
 
     def __init__(self, project: "GitHubProject", source: Optional[Path], spec: Any):
         self.project = project
-        self.source = source
+        self.source = project.resolve_path(source) if source is not None else None
         self.install_spec = spec
 
     def link(self, arg):
@@ -221,7 +385,7 @@ class Installable:
         Argument will have user and environment variables expanded.
         """
         assert self.source is not None
-        link = config.expand_path(arg, self.project.name, asset=self.source.name)
+        link = self.project.resolve_path(config.expand_path(arg, self.project.name, asset=self.source.name))
         if str(arg).endswith('/') or link.is_dir():
             link = link / self.source.name
         if link.is_symlink():
@@ -261,17 +425,38 @@ class Installable:
         assert self.source is not None
         if path is None:
             path = self.source.parent  ## FIXME
+        else:
+            path = self.project.resolve_path(path)
         member_names = []
         if tarfile.is_tarfile(self.source):
             with tarfile.open(self.source) as tar:
-                safe_members = [m for m in tar.getmembers() if
-                                not (Path(m.name).is_absolute() or '..' in Path(m.name).parts)]
-                if len(safe_members) < len(tar.getmembers()):
-                    logger.warning('%s: The tarfile contains unsafe members which will not be extracted: %s',
-                                   self, ', '.join(m.name for m in tar.getmembers() if m not in safe_members))
-                tar.extractall(path, safe_members)
+                unsafe_names = []
+                if hasattr(tarfile, 'data_filter'):
+                    # Python 3.12 (and security backports): let tarfile check the members while extracting
+                    def _filter(member, dest_path):
+                        try:
+                            member = tarfile.data_filter(member, dest_path)
+                        except tarfile.FilterError:
+                            unsafe_names.append(member.name)
+                            return None
+                        member_names.append(member.name)
+                        return member
+
+                    tar.extractall(path, filter=_filter)
+                else:
+                    safe_members = []
+                    for member in tar:
+                        member_path = Path(member.name)
+                        if member_path.is_absolute() or '..' in member_path.parts:
+                            unsafe_names.append(member.name)
+                        else:
+                            safe_members.append(member)
+                    tar.extractall(path, safe_members)
+                    member_names = [m.name for m in safe_members]
+                if unsafe_names:
+                    logger.warning('%s: The tarfile contains unsafe members which have not been extracted: %s',
+                                   self, ', '.join(unsafe_names))
                 logger.info('%s: Extracted tar archive %s to %s', self, self.source, path)
-                member_names = [m.name for m in safe_members]
         elif zipfile.is_zipfile(self.source):
             with zipfile.ZipFile(self.source) as z:
                 z.extractall(path)  # handles unsafe members itself
@@ -280,8 +465,16 @@ class Installable:
         else:
             logger.error('%s: %s could not be identified as an archive, not unpacked.', self, self.source)
 
-        project_directory = self.project.directory.resolve()  # type:ignore
-        extracted_files = [(path / member).resolve().relative_to(project_directory) for member in member_names]
+        # the member names have been checked for '..' and absolute paths, so they can be joined lexically
+        project_prefix = fspath(self.project.directory.resolve()) + sep
+        target = fspath(path.resolve())
+        extracted_files = []
+        for member in member_names:
+            extracted = normpath(join(target, member))
+            if extracted.startswith(project_prefix):
+                extracted_files.append(Path(extracted[len(project_prefix):]))
+            else:
+                logger.warning('%s: %s has been extracted outside of the project directory', self, extracted)
         self.project.register_installed_file(*extracted_files)
         return extracted_files
 
@@ -306,10 +499,8 @@ class Installable:
             else:
                 raise ValueError('delete (without source) requires an argument')
 
-            safe_candidates = sorted([c for c in candidates if c.is_relative_to(project_directory)
-                                      or c in self.project.installed_files],
-                                     key=lambda p: len(p.parts),
-                                     reverse=True)
+            safe_candidates = _deepest_first(c for c in candidates if c.is_relative_to(project_directory)
+                                             or c in self.project.installed_files)
             deleted_candidates = []
             for candidate in safe_candidates:
                 try:
@@ -325,13 +516,8 @@ class Installable:
         return []
 
     def _expand_arg(self, arg):
-        with self.project.directory as project_directory:
-            arg_path = config.expand_path(arg, self.project.name)
-            if arg_path.is_absolute():
-                candidates = [Path(p) for p in glob(fspath(arg_path))]
-            else:
-                candidates = list(project_directory.glob(fspath(arg_path)))
-            return candidates
+        arg_path = config.expand_path(arg, self.project.name)
+        return _glob(self.project.directory, arg_path)
 
     def record(self, arg):
         """
@@ -395,13 +581,16 @@ class Installable:
                 elif not new_sources:
                     logger.warning('No install configuration and no extra sources found', self.install_spec)
 
-            project_spec = self.project.config.get('install', {})
+            # every rule whose pattern matches a source is run, so we cannot stop at the first match
+            project_rules = [(compile_glob(pattern), pattern, spec)
+                             for pattern, spec in self.project.config.get('install', {}).items()]
             while new_sources:
                 source = new_sources.pop(0)
-                is_in_pd = source.absolute().is_relative_to(self.project.directory)
-                for pattern, spec in project_spec.items():
-                    matches_pattern = fnmatch(source, pattern)
-                    if is_in_pd and matches_pattern:
+                if not self.project.resolve_path(source).is_relative_to(self.project.directory):
+                    continue
+                source_str = normcase(fspath(source))
+                for regex, pattern, spec in project_rules:
+                    if regex.match(source_str):
                         logger.debug('Identified install rule %s=%s for %s', pattern, spec, source)
                         installable = Installable(self.project, source, spec)
                         new_sources.extend(installable._run_actions(spec))
@@ -453,10 +642,14 @@ class GitHubProject(Installable):
     ## config -> use property config
     name: str
     _projects_config: Optional[BaseSettings] = None
+    _detached_config: Optional[MutableMapping] = None
 
     @property
-    @lru_cache()
     def config(self) -> MutableMapping:
+        if self._detached_config is not None:
+            return self._detached_config
+        # not cached: the lookup is cheap, and going through the settings object each time lets it
+        # notice that the project's table may be modified
         if self._projects_config is None:
             self._projects_config = config.edit_projects()
         if self.name not in self._projects_config:
@@ -465,6 +658,9 @@ class GitHubProject(Installable):
 
     @config.setter
     def config(self, value: Mapping):
+        if self._detached_config is not None:
+            self._detached_config = value
+            return
         if self._projects_config is None:
             self._projects_config = config.edit_projects()
         self._projects_config[self.name] = value
@@ -474,12 +670,21 @@ class GitHubProject(Installable):
         returns a string represantation that is relative to the project directory
         or absolute, with symlinks resolved
         """
-        orig_path = self.resolve_path(orig)
+        key = fspath(orig)
         try:
-            rel_path = orig_path.relative_to(self.directory)
-        except ValueError:
-            rel_path = orig_path
-        return fspath(rel_path)
+            return self._relative_fspaths[key]
+        except KeyError:
+            pass
+        abs_path = fspath(self.resolve_path(orig))
+        directory = fspath(self.directory)
+        if abs_path.startswith(directory + sep):
+            rel_path = abs_path[len(directory) + 1:]
+        elif abs_path == directory:
+            rel_path = '.'
+        else:
+            rel_path = abs_path
+        self._relative_fspaths[key] = rel_path
+        return rel_path
 
     @property
     def configured(self) -> bool:
@@ -489,8 +694,12 @@ class GitHubProject(Installable):
         """
         Returns an absolute path, resolved against the project directory
         """
-        with self.use_directory():
-            return Path(orig).absolute()
+        key = fspath(orig)
+        try:
+            return self._resolved_paths[key]
+        except KeyError:
+            result = self._resolved_paths[key] = Path(join(fspath(self.directory), key))
+            return result
 
     @property
     def installed_files(self) -> List[str]:
@@ -501,55 +710,91 @@ class GitHubProject(Installable):
             self.state['installed_files'] = []
         return self.state['installed_files']
 
+    def _installed_files_set(self) -> Set[str]:
+        """
+        The installed files as a set, for fast membership tests. Kept in sync with the list in the state.
+        """
+        file_list = self.installed_files
+        if file_list is not self._installed_set_source or len(file_list) != len(self._installed_set):
+            self._installed_set = set(file_list)
+            self._installed_set_source = file_list
+        return self._installed_set
+
     def register_installed_file(self, *files):
         file_list = self.installed_files
+        file_set = self._installed_files_set()
         for file in map(self.project_relative_fspath, files):
-            if file not in file_list:
+            if file not in file_set:
+                file_set.add(file)
                 file_list.append(file)
 
     def unregister_installed_file(self, *files):
+        file_set = self._installed_files_set()
+        removed = set()
         for file in map(self.project_relative_fspath, files):
-            if file in self.installed_files:
-                self.installed_files.remove(file)
+            if file in file_set:
+                file_set.discard(file)
+                removed.add(file)
                 logger.debug('unregistered %s', file)
             else:
                 logger.debug('%s not registered, cannot unregister', file)
+        if removed:
+            self.installed_files[:] = [file for file in self.installed_files if file not in removed]
 
     def get_installed(self, include_unknown=False) -> List[ProjectFile]:
-        installed_files = self.installed_files
-        project_dir_files = set(map(self.project_relative_fspath,
-                                    (p for p in self.directory.rglob('*')
-                                     if
-                                     not (p.is_dir() or p.is_relative_to(config.project_state_directory(self.name))))))
-        unknown_files = project_dir_files - set(installed_files)
-        return [ProjectFile(self, f) for f in self.installed_files] + [ProjectFile(self, f, unregistered=True) for f in
-                                                                       unknown_files]
+        """
+        Returns the files installed for this project. With include_unknown, the project directory is
+        scanned for unregistered files as well.
+        """
+        assets = self.assets_by_source()
+        result = [ProjectFile(self, f, assets=assets) for f in self.installed_files]
+        if include_unknown:
+            state_dir = fspath(config.project_state_directory(self.name).relative_to(self.directory))
+            installed = self._installed_files_set()
+            result.extend(ProjectFile(self, f, unregistered=True, assets=assets)
+                          for f in _scan_files(self.directory, exclude={state_dir}) if f not in installed)
+        return result
+
+    def assets_by_source(self) -> Mapping[Path, 'GithubAsset']:
+        """
+        Maps the absolute source paths of the configured assets to the assets.
+        """
+        result = {}
+        for asset in self.get_assets():
+            result.setdefault(asset.source.absolute(), asset)
+        return result
 
     def uninstall(self, keep_assets=False):
         count = 0
+        uninstalled = []
         with self.use_directory():
             parents = set()
-            for project_file in sorted(self.get_installed(), key=lambda pf: len(pf.path.parts), reverse=True):
+            for project_file in _deepest_first(self.get_installed(include_unknown=True), path=attrgetter('path')):
                 try:
                     if keep_assets and project_file.asset:
                         continue
                     if project_file.path.parent.is_relative_to(self.directory):
                         parents.add(project_file.path.parent)
-                    if project_file.path.is_dir():
+                    try:
+                        mode = lstat(project_file.path).st_mode
+                    except FileNotFoundError:
+                        mode = None
+                    if mode is None:
+                        logger.warning('%s (belonging to %s) does not exist, so uninstalling it is a no-op',
+                                       project_file, self)
+                    elif S_ISDIR(mode):
                         project_file.path.rmdir()
                         count += 1
-                    elif project_file.path.is_symlink() or project_file.path.exists():
+                    else:
                         project_file.path.unlink()
                         count += 1
                         logger.debug('uninstalled %s', project_file)
-                    else:
-                        logger.warning('%s (belonging to %s) does not exist, so uninstalling it is a no-op',
-                                       project_file, self)
-                    self.unregister_installed_file(project_file.path)
+                    uninstalled.append(project_file.path)
                 except IOError as e:
                     logger.error('Unable to delete %s (%s) while uninstalling %s', project_file, e, self)
+            self.unregister_installed_file(*uninstalled)
         # now cleanup empty directories
-        for parent in sorted(parents, key=lambda p: len(p.parts), reverse=True):
+        for parent in _deepest_first(parents):
             try:
                 if parent.exists() and parent != self.directory:
                     parent.rmdir()
@@ -574,15 +819,20 @@ class GitHubProject(Installable):
         # The project needs a name before it can access its configuration. If project_config is given,
         # or if the name string is a name from the projects list, we assume there's no magic needed,
         # otherwise we try to parse the name string to identify the project URL.
+        self._resolved_paths = {}
+        self._relative_fspaths = {}
+        self._installed_set: Set[str] = set()
+        self._installed_set_source: Optional[List[str]] = None
+        self._releases: Optional[Tuple[Any, List[Release]]] = None
         projects = config.edit_projects()
         if name not in projects and project_config is None:
-            if re.match('https?://', name):
+            if _HTTP_URL.match(name):
                 user, repo = self.parse_github_url(name)
-            elif re.match(r'([^/\s]+)/([^/\s]+)', name):
-                m = re.match(r'([^/\s]+)/([^/\s]+)', name)
-                user, repo = m.groups()
             else:
-                raise ValueError(f'Project {name} needs an URL')
+                m = _USER_REPO.match(name)
+                if not m:
+                    raise ValueError(f'Project {name} needs an URL')
+                user, repo = m.groups()
             url = f'https://github.com/{user}/{repo}'
             if repo in projects:
                 ex_config = projects[repo]
@@ -607,8 +857,23 @@ class GitHubProject(Installable):
         self.asset_cache = config.JSONSettings(config.project_state_directory(self.name) / 'assets.json')
         self.project = self
 
+    def detach_config(self):
+        """
+        Lets the project work on a private copy of its configuration, which attach_config() merges back.
+
+        The projects document is shared by all projects and not thread-safe, so projects that are handled
+        in worker threads are detached (and attached again) on the main thread.
+        """
+        self._detached_config = deepcopy(self.config)
+
+    def attach_config(self):
+        detached, self._detached_config = self._detached_config, None
+        if detached is not None and detached != self.config:
+            _merge_into(self.config, detached)
+
     def save(self):
-        config.edit_projects().save()
+        if self._detached_config is None:  # otherwise, the config is saved after attach_config()
+            config.edit_projects().save()
         self.state.save()
         self.release_cache.save()
         self.asset_cache.save()
@@ -621,7 +886,7 @@ class GitHubProject(Installable):
         Returns:
             user, repo
         """
-        m = re.match(r'https?://(?:[^/]+\.)?github.com/([^/?\s]+)/([^/?\s]+)', url)
+        m = _GITHUB_URL.match(url)
         if m:
             return m.group(1), m.group(2)
         else:
@@ -629,7 +894,7 @@ class GitHubProject(Installable):
 
     def augment_config(self):
         if 'github' not in self.config and 'url' in self.config:
-            m = re.match(r'https?://(?:[^/]+\.)?github.com/(\w+)/(\w+)', self.config['url'])
+            m = _GITHUB_URL.match(self.config['url'])
             if m:
                 self.user = m.group(1)
                 self.repo = m.group(2)
@@ -655,16 +920,14 @@ class GitHubProject(Installable):
         """
         work in self.directory.
 
+        This does _not_ change the process's working directory, relative paths need to be
+        resolved using resolve_path(), and subprocesses need to be started with cwd=pd.
+
         Example:
             with project.use_directory() as pd:
-                assert Path.cwd() == pd
+                subprocess.run(command, cwd=pd)
         """
-        old_cwd = Path.cwd()
-        chdir(self.directory)
-        # logger.debug('Changed into project directory: %s (from %s)', self.directory, old_cwd)
         yield self.directory
-        chdir(old_cwd)
-        # logger.debug('Changed back to %s', old_cwd)
 
     def update(self, all_releases=False) -> bool:
         """
@@ -677,35 +940,39 @@ class GitHubProject(Installable):
         with self.release_cache as cache, self.state as state:
             releases_updated = fetch_if_newer(update_url, cache, message=f'Updating {self}',
                                               json='application/vnd.github+json')  # type:ignore # - will be bool
-            state['updated'] = datetime.now().isoformat()
+            changes = {'updated': datetime.now().isoformat()}
+            needs_download = False
             if releases_updated:
                 selected_release = self.select_release()
                 if selected_release:
-                    state['candidate'] = selected_release.version
-                    if state['candidate'] != state.get('installed'):
+                    changes['candidate'] = selected_release.version
+                    if changes['candidate'] != state.get('installed'):
                         logger.info('%s: New release %s available', self.name, selected_release)
-                        return True
-                    else:
-                        return False
+                        needs_download = True
                 else:
                     if release_config:
                         logger.warning('%s: No release matching %s found.', self.name, release_config)
-                    state['candidate'] = None
-                    return False  # no release, no update
+                    changes['candidate'] = None  # no release, no update
             else:
                 logger.debug('%s: Releases not updated.', self.name)
-                return False
+            state.update(changes)
+            return needs_download
 
     @property
     def releases(self) -> List[Release]:
-        releases = self.release_cache.get('data')
-        if not releases:
-            return []
-        elif isinstance(releases, Mapping):
-            return [GitHubRelease(releases)]
-        else:
-            return [GitHubRelease(r) for r in sorted(releases, key=itemgetter('created_at'),
-                                                     reverse=True)]  # type:ignore #- if its not a list, its a mapping
+        # read-only access to the data, so the (potentially large) release cache is not marked as modified
+        releases = self.release_cache.data.get('data')
+        if self._releases is None or self._releases[0] is not releases:
+            if not releases:
+                release_list = []
+            elif isinstance(releases, Mapping):
+                release_list = [GitHubRelease(releases)]
+            else:
+                release_list = [GitHubRelease(r) for r in sorted(releases, key=itemgetter('created_at'),
+                                                                 reverse=True)]  # type:ignore #- if its not a list, its a mapping
+            # fetching new release data replaces the data object, which invalidates this cache
+            self._releases = releases, release_list
+        return list(self._releases[1])
 
     def select_release(self) -> Optional[Release]:
         release_config = self.config.get('release', '')
@@ -720,7 +987,7 @@ class GitHubProject(Installable):
             return first((release for release in releases if not release.data['draft']), default=None)
         else:
             return first((release for release in releases if
-                          fnmatch(release.version, release_config) and not release.data['draft']), default=None)
+                          glob_match(release.version, release_config) and not release.data['draft']), default=None)
 
     def get_assets(self, release=None, configured=True) -> List['GithubAsset']:
         result = []
@@ -730,7 +997,7 @@ class GitHubProject(Installable):
             return result
         if configured:
             for pattern, install in self.config.get('assets', {}).items():
-                matching_descs = [asset for asset in release.data['assets'] if fnmatch(asset['name'], pattern)]
+                matching_descs = [asset for asset in release.data['assets'] if glob_match(asset['name'], pattern)]
                 if len(matching_descs) == 0:
                     logger.warning('%s %s: No asset matching %s found', self.name, release, pattern)
                 else:
@@ -745,14 +1012,14 @@ class GitHubProject(Installable):
                 result.append(GithubAsset(self, release, None, None, desc))
         return result
 
-    def download(self):
+    def download(self, force: bool = False):
         if self.needs_update:
             self.update()
         needs_install = False
         with self.asset_cache:
             for asset in self.get_assets():
                 try:
-                    asset_needs_install = bool(asset.download())
+                    asset_needs_install = bool(asset.download(force=force))
                     needs_install |= asset_needs_install
                 except Exception as e:
                     logger.exception('Failed to download %s for %s: %s', asset.source.name, self.name, e)
@@ -765,7 +1032,7 @@ class GitHubProject(Installable):
         if release is None:
             logger.error('No matching release found for project %s. Maybe run %s add %s again',
                          self, config.APP_NAME, self)
-        needs_install = self.download()
+        needs_install = self.download(force=force)
         if needs_install or self.needs_upgrade or force or not self.state.get('installed'):
             super().install(including_assets=including_assets)
             if 'postinstall' in self.config:
@@ -804,13 +1071,17 @@ class GitHubProject(Installable):
         """
         Executes the given script.
 
-        If the script starts with #!, it is saved to a temporary file that is made executable
-        and then launched. Otherwise, it is run with python subprocess's shell=True feature.
+        If the script starts with #!, it is made executable and launched directly: On Linux, it is written
+        to an anonymous in-memory file (memfd) and run as /proc/self/fd/N, so that is what the script
+        sees as $0. Elsewhere, it is saved to a temporary file that is deleted afterwards. Otherwise,
+        it is run with python subprocess's shell=True feature.
         The working directory will be the project directory. Additionally, the variables PROJECT (with the
         project name) and PROJECT_DIR (with the project directory) will be defined.
 
         if record_new_files is a list, new files _in the project directory_ will be recorded and added to
-        the list. Files created by the script outside the project directory will never be detected.
+        the list. Files created by the script outside the project directory will never be detected. Neither
+        will files created in existing directories named in the project's exec_script_ignore setting
+        (default: .git, .venv, __pycache__, node_modules).
 
         If capture is true, stdin and stdout will be captured. Each line written to stdin will be considered
         a file path and will be added to record_new_files. stderr, if non-empty, will be logged at
@@ -824,13 +1095,23 @@ class GitHubProject(Installable):
 
         with self.use_directory() as project_directory:
             if record_new_files is not None:
-                files_before = set(project_directory.glob('**/*'))
-            else:
-                files_before = set()
+                snapshot_ns = time_ns()
+                ignore = frozenset(self.config.get('exec_script_ignore', _EXEC_SCRIPT_IGNORE))
+                snapshot = _snapshot_tree(fspath(project_directory), ignore)
             project_env = dict(environ)
             project_env['PROJECT'] = self.name
             project_env['PROJECT_DIR'] = fspath(project_directory)
-            if script[:2] == '#!':
+            if script[:2] == '#!' and hasattr(os, 'memfd_create') and os.path.isdir('/proc/self/fd'):
+                # Linux: run the script from an anonymous in-memory file, there is nothing to clean up
+                fd = os.memfd_create('getrel-script')
+                try:
+                    os.write(fd, script.encode())
+                    os.fchmod(fd, 0o700)
+                    result = run([f'/proc/self/fd/{fd}'], pass_fds=(fd,), env=project_env, cwd=project_directory,
+                                 capture_output=capture, text=True)
+                finally:
+                    os.close(fd)
+            elif script[:2] == '#!':
                 with NamedTemporaryFile("wt", delete=False) as scriptfile:
                     scriptfile.write(script)
                     scriptpath = Path(scriptfile.name)
@@ -844,12 +1125,11 @@ class GitHubProject(Installable):
                 result = run(script, shell=True, env=project_env, cwd=project_directory, capture_output=capture,
                              text=True)
             if record_new_files is not None:
-                files_after = set(project_directory.glob('**/*'))
-                new_files = files_after - files_before
-                record_new_files.extend(new_files)
+                record_new_files.extend(Path(path) for path in
+                                        _new_paths(fspath(project_directory), snapshot, snapshot_ns, ignore))
 
                 if capture:
-                    captured_files = [Path(line) for line in result.stdout.split('\n') if line]
+                    captured_files = [self.resolve_path(line) for line in result.stdout.split('\n') if line]
                     record_new_files.extend([path for path in captured_files if path.exists()])
             if capture and result.stderr:
                 logger.log(logging.INFO if result.returncode == 0 else logging.ERROR, result.stderr)
@@ -885,11 +1165,12 @@ class GithubAsset(Installable):
         self.match = match
         self.install_spec = install
         if match is None and 'assets' in project.config:
-            self.match = first((a for a in project.config['assets'] if fnmatch(asset_desc['name'], a)), default=None)
+            self.match = first((a for a in project.config['assets'] if glob_match(asset_desc['name'], a)), default=None)
             if self.match is not None:
                 self.install_spec = project.config['assets'][self.match]
         self.asset_desc = asset_desc
         self.source = config.project_directory(self.project.name) / self.asset_desc['name']
+        self._title: Optional[str] = None
 
     @property
     def configured(self):
@@ -907,6 +1188,7 @@ class GithubAsset(Installable):
             self.match = match
         if install:
             if isinstance(install, Mapping):
+                import tomlkit
                 self.install_spec = tomlkit.inline_table()
                 self.install_spec.update(install)
             else:
@@ -926,12 +1208,15 @@ class GithubAsset(Installable):
         self.match = self.install_spec = None
 
     def __str__(self):
-        asset = self.asset_desc
-        title = asset['name']
-        if asset['label'] and asset['label'] != title:
-            title += f' "{asset["label"]}"'
-        title += f' ({naturalsize(asset["size"])}, {asset["download_count"]} downloads)'
-        return title
+        # the release's asset description does not change, and the title is used in every log message
+        if self._title is None:
+            asset = self.asset_desc
+            title = asset['name']
+            if asset['label'] and asset['label'] != title:
+                title += f' "{asset["label"]}"'
+            title += f' ({naturalsize(asset["size"])}, {asset["download_count"]} downloads)'
+            self._title = title
+        return self._title
 
     def download(self, force: bool = False):
         with self.project.asset_cache as cache:
@@ -943,12 +1228,44 @@ class GithubAsset(Installable):
                                      download_file=self.source,
                                      message=str(self),
                                      headers={'Accept': 'application/octet-stream'},
+                                     force=force,
                                      stream=True)
             if updated:
                 self.project.register_installed_file(self.source)
             return updated
 
 
+def run_parallel(projects: Iterable[GitHubProject], action: Callable[[GitHubProject], T], max_workers: int = 8) \
+        -> List[Tuple[GitHubProject, Optional[T], Optional[BaseException]]]:
+    """
+    Calls action(project) for each of the projects in a thread pool, for actions that mostly wait for GitHub.
+
+    While the action runs, each project works on a detached copy of its configuration (see
+    GitHubProject.detach_config), so the actions must not access the shared projects document otherwise.
+
+    Returns:
+        (project, result, exception) for each project, in the order of the given projects.
+        exception is None if the action succeeded.
+    """
+    projects = list(projects)
+    if not projects:
+        return []
+    config.settings  # loaded lazily, and the workers should not race for that
+    for project in projects:
+        project.detach_config()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(projects)))) as executor:
+            futures = [executor.submit(action, project) for project in projects]
+        results = []
+        for project, future in zip(projects, futures):
+            exception = future.exception()
+            results.append((project, None if exception else future.result(), exception))
+        return results
+    finally:
+        for project in projects:
+            project.attach_config()
+
+
 def get_project(name: str, must_exist: bool = True) -> GitHubProject:  # TODO refactor
     """
     Returns an existing project
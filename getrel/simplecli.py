@@ -1,11 +1,9 @@
 import sys
 from typing import List
 
-from .project import get_project
 from .config import edit_projects 
 import argparse
 
-from getrel import project
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,17 +16,28 @@ def _install(args):
 def _upgrade(args):
     _do_install(args.projects, update=True)
 
+def _install_one(project):
+    logger.info('Installing %s', project)
+    project.install()
+
+
 def _do_install(project_names: List[str], update: bool = False):
     print(project_names)
     if not project_names:
         project_names = list(edit_projects())
+    if not project_names:
+        return
+    from .project import get_project, run_parallel
+    projects = []
     for project_name in project_names:
         try:
-            project = get_project(project_name)
-            logger.info('Installing %s', project)
-            project.install()
+            projects.append(get_project(project_name))
         except Exception as e:
             logger.error('Failed to install %s: %s', project_name, e, exc_info=True)
+    # installing is dominated by waiting for GitHub, so the projects are handled in parallel
+    for project, _, e in run_parallel(projects, _install_one):
+        if e is not None:
+            logger.error('Failed to install %s: %s', project, e, exc_info=e)
             
 
 def main():
@@ -1,28 +1,77 @@
 from datetime import datetime, timedelta
+from fnmatch import translate
+from functools import lru_cache
+from hashlib import blake2b
+from os import fspath, replace
+from os.path import normcase
 from pathlib import Path
 from tarfile import is_tarfile
-from typing import TypeVar, Iterable, MutableMapping, Sequence, Callable, Optional, Union, Dict
+from typing import TYPE_CHECKING, TypeVar, Iterable, MutableMapping, Sequence, Callable, Optional, Union, Dict, List, Tuple
 import stat
+import threading
+from time import time
 from mimetypes import guess_type
 from typing import Optional
 from zipfile import is_zipfile
-import email.utils as eut
 
-import requests
+import re
 import logging
 
-from .config import get_progress, settings
+if TYPE_CHECKING:
+    import requests
+
+from . import config
+from .config import get_progress
 
 logger = logging.getLogger(__name__)
 
+
+@lru_cache(maxsize=None)
+def _humanize_naturalsize() -> Optional[Callable[..., str]]:
+    try:
+        from humanize import naturalsize
+        return naturalsize
+    except ImportError:
+        return None
+
+
+def naturalsize(size: int, **kwargs) -> str:
+    humanize_naturalsize = _humanize_naturalsize()
+    if humanize_naturalsize is None:
+        return str(size)
+    return humanize_naturalsize(size, **kwargs)
+
+
 try:
-    from humanize import naturalsize
+    import orjson
 except ImportError:
-    def naturalsize(size: int, **kwargs):
-        return str(size)
+    orjson = None
 
 T = TypeVar('T')
 _no_default = object()
+_DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # large reads keep per-chunk overhead (hashing, progress) negligible
+
+
+def _response_json(response: 'requests.Response'):
+    """Parses the response body as JSON, raising a ValueError if it isn't."""
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return response.json()
+
+
+_thread_local = threading.local()
+
+
+def _http_session() -> 'requests.Session':
+    """
+    The HTTP session for the current thread, so connections to the same host are reused.
+    requests does not guarantee that sessions can be shared between threads.
+    """
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        import requests
+        session = _thread_local.session = requests.Session()
+    return session
 
 
 def first(iterable: Iterable[T], *, default=_no_default, strict=False) -> T:
@@ -36,18 +85,16 @@ def first(iterable: Iterable[T], *, default=_no_default, strict=False) -> T:
     Raises:
         ValueError if iterable is empty and default is missing or if strict is true and iterable contains not exactly one item
     """
-    try:
-        iterator = iter(iterable)
-        result = next(iterator)
-    except StopIteration:
+    iterator = iter(iterable)
+    result = next(iterator, _no_default)
+    if result is _no_default:
         if strict or default is _no_default:
             raise ValueError(f'{iterable} is empty')
         else:
             return default  # type: ignore
     if strict:
-        try:
-            second = next(iterator)
-        except StopIteration:
+        second = next(iterator, _no_default)
+        if second is _no_default:
             return result
         raise ValueError(f'More than one value: {[result, second, ...]}')
     else:
@@ -60,6 +107,52 @@ except ImportError:
     magic = None
 
 
+_MAGIC_HEAD_SIZE = 64 * 1024  # enough for libmagic to recognize the formats we care about
+
+
+@lru_cache(maxsize=None)
+def _magic(mime: bool) -> 'magic.Magic':
+    return magic.Magic(mime=mime)
+
+
+def _detect_file_type(file: Path, mode: Optional[int]) -> Tuple[Optional[str], str, bool, bool]:
+    """
+    Detects mime type, description, executable and archive flags of file. mode is None for anything
+    that is not a regular file.
+    """
+    head = b''
+    if mode is not None:
+        with file.open('rb') as f:
+            head = f.read(_MAGIC_HEAD_SIZE)
+    if magic is not None and mode is not None:
+        mime = _magic(mime=True).from_buffer(head)
+        description = _magic(mime=False).from_buffer(head) or 'unknown'
+    elif magic is not None:
+        mime = magic.from_file(file, mime=True)
+        description = magic.from_file(file) or 'unknown'
+    else:
+        mime = guess_type(file, strict=False)[0]
+        description = mime or "unknown"
+
+    executable = archive = False
+    if mode is not None and mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
+        executable = True
+    elif mime is not None and ('executable' in mime or 'script' in mime):
+        executable = True
+    elif is_tarfile(file) or is_zipfile(file):
+        archive = True
+    elif head[:2] == b'#!':
+        executable = True
+    return mime, description, executable, archive
+
+
+@lru_cache(maxsize=4096)
+def _probe_file(path: str, device: int, inode: int, size: int, mtime_ns: int, mode: int) \
+        -> Tuple[Optional[str], str, bool, bool]:
+    """Cached _detect_file_type for regular files, the arguments besides path identify the file's state."""
+    return _detect_file_type(Path(path), mode)
+
+
 class FileType:
     """
     Tries to detect the filetype of the given file (which may be a string or
@@ -83,27 +176,18 @@ class FileType:
         if not isinstance(file, Path):
             file = Path(file)
         self.file = file
-        if file.is_dir():
+        try:
+            st = file.stat()
+        except OSError:
+            st = None
+        if st is not None and stat.S_ISDIR(st.st_mode):
             self.mime = 'inode/directory'
             self.description = 'Directory'
-            return
-        elif magic is not None:
-            self.mime = magic.from_file(file, mime=True)
-            self.description = magic.from_file(file) or 'unknown'
+        elif st is not None and stat.S_ISREG(st.st_mode):
+            self.mime, self.description, self.executable, self.archive = \
+                _probe_file(fspath(file), st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_mode)
         else:
-            self.mime = guess_type(file, strict=False)[0]
-            self.description = self.mime or "unknown"
-
-        if file.is_file() and file.stat().st_mode & (stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH):
-            self.executable = True
-        elif self.mime is not None and ('executable' in self.mime or 'script' in self.mime):
-            self.executable = True
-        elif is_tarfile(file) or is_zipfile(file):
-            self.archive = True
-        elif file.is_file():
-            with file.open(errors='ignore') as f:
-                if f.read(2) == '#!':
-                    self.executable = True
+            self.mime, self.description, self.executable, self.archive = _detect_file_type(file, None)
 
     def __str__(self):
         result = self.mime
@@ -119,7 +203,8 @@ class FileType:
 
 def fetch_if_newer(url: str, cache: MutableMapping, *, download_file: Optional[Path] = None, json: Union[
     bool, str] = False,
-                   return_response: bool = False, cache_headers: bool = False, headers=None, message=None, **kwargs):
+                   return_response: bool = False, cache_headers: bool = False, headers=None, message=None,
+                   force: bool = False, **kwargs):
     """
     Retrieves the given URL unless it has not been modified.
 
@@ -130,9 +215,12 @@ def fetch_if_newer(url: str, cache: MutableMapping, *, download_file: Optional[P
     Args:
         url: The URL to get
         cache: A dictionary to use for caching, may be empty. The function will use the keys 'ETag' and 'Last-Modified' for the corresponding response headers and
-               the 'data' key for the response unless download_file is given.
+               the 'data' key for the response unless download_file is given. 'last-request' and 'Last-Modified-epoch'
+               hold the time of the last request and the parsed Last-Modified header as seconds since the epoch.
         download_file:
             if given, the request's result will be saved to this file instead of to the 'data' key of the result dict.
+            A digest of the content is kept in the cache's 'content-digest' key, and the file is left untouched if
+            the downloaded bytes did not change.
         json:
             if True, explicitely request JSON. cache['ðata'] will be assigned the parsed JSON result. If a str, set the Accept: header
             to the string and handle it as if it were True otherwise.
@@ -144,26 +232,44 @@ def fetch_if_newer(url: str, cache: MutableMapping, *, download_file: Optional[P
             additional request headers
         cache_headers:
             if True, cache response headers in the cache mapping
+        force:
+            if True, ask the server even if the configured delays have not passed yet. A download_file
+            that does not exist (anymore) is always downloaded completely.
     Returns:
         True if actual data has been retrieved, updating the cache dict and optionally writing to the download_file as side effect.
-        False if the data has not been newer.
+        False if the data has not been newer, or if the downloaded file's content did not change.
         a response if return_response is true and True would have been returned.
     """
+    import requests
+
+    # a removed download (e.g., after unpacking or uninstalling) can only be restored by a full download
+    missing_download = download_file is not None and not download_file.exists()
+    force = force or missing_download
+
+    now = time()
     last_requested_ago = None
-    if 'last-request' in cache:
-        last_requested_ago = datetime.now() - datetime.fromisoformat(cache['last-request'])
-        if last_requested_ago  <= settings.fetch_delay:  # type:ignore
+    if force:
+        logger.debug('Fetching %s unconditionally', url)
+    elif 'last-request' in cache:
+        last_request = cache['last-request']
+        if isinstance(last_request, str):  # written by older versions
+            last_request = datetime.fromisoformat(last_request).timestamp()
+        last_requested_ago = timedelta(seconds=now - last_request)
+        if last_requested_ago  <= config.settings.fetch_delay:  # type:ignore
             logger.debug('Not fetching %s, last request was less then %s ago (%s)', url, last_requested_ago,
-                         settings.fetch_delay)
+                         config.settings.fetch_delay)
             return False
     last_modified_ = None
-    if 'Last-Modified' in cache:
-        last_modified_ = datetime.now() - parse_http_date(cache['Last-Modified'])
-        if last_modified_ <= settings.update_delay:  # type:ignore
-            logger.debug('Not fetching %s, last modified less then %s ago (%s)', url, last_modified_, settings.update_delay)
+    if 'Last-Modified' in cache and not force:
+        last_modified = cache.get('Last-Modified-epoch')
+        if last_modified is None:
+            last_modified = parse_http_date(cache['Last-Modified']).timestamp()
+        last_modified_ = timedelta(seconds=now - last_modified)
+        if last_modified_ <= config.settings.update_delay:  # type:ignore
+            logger.debug('Not fetching %s, last modified less then %s ago (%s)', url, last_modified_, config.settings.update_delay)
             return False
-    logger.debug('%s last modified %s (> %s), last requested %s (> %s)', url, last_modified_, settings.update_delay,
-                 last_requested_ago, settings.fetch_delay)
+    logger.debug('%s last modified %s (> %s), last requested %s (> %s)', url, last_modified_, config.settings.update_delay,
+                 last_requested_ago, config.settings.fetch_delay)
 
     with get_progress(transient=True) as progress:
         progress_msg = str(message or download_file or url)
@@ -173,13 +279,13 @@ def fetch_if_newer(url: str, cache: MutableMapping, *, download_file: Optional[P
             headers = {}
         if json:
             headers['Accept'] = 'application/json'
-        if download_file is None or download_file.exists():
+        if not missing_download:
             if 'ETag' in cache:
                 headers['If-None-Match'] = str(cache['ETag'])
             if 'Last-Modified' in cache:
                 headers['If-Modified-Since'] = str(cache['Last-Modified'])
-        response = requests.get(url, headers=headers, **kwargs)
-        cache['last-request'] = datetime.now().isoformat()
+        response = _http_session().get(url, headers=headers, **kwargs)
+        cache['last-request'] = time()
         if response.status_code == requests.codes.not_modified:
             logger.debug('%s: Not modified', url)
             progress.stop_task(task_id)
@@ -195,25 +301,42 @@ def fetch_if_newer(url: str, cache: MutableMapping, *, download_file: Optional[P
             cache['ETag'] = response.headers['ETag']
         if 'Last-Modified' in response.headers:
             cache['Last-Modified'] = response.headers['Last-Modified']
+            try:
+                cache['Last-Modified-epoch'] = parse_http_date(cache['Last-Modified']).timestamp()
+            except (TypeError, ValueError):
+                cache.pop('Last-Modified-epoch', None)
         if cache_headers:
             cache['headers'] = dict(response.headers)
         if download_file:
             logger.debug('%s: Downloading to %s', url, download_file)
             download_file.parent.mkdir(parents=True, exist_ok=True)
-            with download_file.open('wb') as f:
-                progress.start_task(task_id)
-                for chunk in response.iter_content(chunk_size=512 * 1024):
-                    progress.advance(task_id, len(chunk))
-                    f.write(chunk)
+            part_file = download_file.with_name(download_file.name + '.part')
+            digest = blake2b(digest_size=16)
+            try:
+                with part_file.open('wb') as f:
+                    progress.start_task(task_id)
+                    for chunk in response.iter_content(chunk_size=_DOWNLOAD_CHUNK_SIZE):
+                        progress.advance(task_id, len(chunk))
+                        digest.update(chunk)
+                        f.write(chunk)
+            except BaseException:
+                part_file.unlink()
+                raise
+            content_digest = digest.hexdigest()
+            if cache.get('content-digest') == content_digest and download_file.exists():
+                logger.debug('%s: Downloaded content is unchanged, keeping %s', url, download_file)
+                part_file.unlink()
+                return False
+            replace(part_file, download_file)
+            cache['content-digest'] = content_digest
         elif json:
             logger.debug('%s: Downloading JSON to cache', url)
-            cache['data'] = response.json()
+            cache['data'] = _response_json(response)
         else:
             logger.debug('%s: Downloading data to cache', url)
             try:
-                json = response.json()
-                cache['data'] = response.json()
-            except requests.JSONDecodeError:
+                cache['data'] = _response_json(response)
+            except ValueError:  # includes requests' and orjson's JSONDecodeError
                 if response.encoding is not None:
                     cache['data'] = response.text
                 else:
@@ -251,6 +374,50 @@ def unique_substrings(strings: Iterable[str]) -> Dict[str, str]:
     return unique
 
 
+@lru_cache(maxsize=None)
+def compile_glob(pattern: str) -> 're.Pattern[str]':
+    """
+    Returns a compiled regular expression for the given shell glob pattern (cf. fnmatch).
+    """
+    return re.compile(translate(normcase(pattern)))
+
+
+@lru_cache(maxsize=None)
+def _glob_matcher(pattern: str) -> Callable[[str], bool]:
+    """
+    Returns a predicate for normcased names that matches the given shell glob pattern.
+
+    Patterns without wildcards or with just a single * are checked using string comparisons,
+    all others using the compiled regular expression.
+    """
+    pattern = normcase(pattern)
+    if '?' not in pattern and '[' not in pattern:
+        stars = pattern.count('*')
+        if stars == 0:
+            return pattern.__eq__
+        elif stars == 1:
+            prefix, suffix = pattern.split('*')
+            min_length = len(pattern) - 1
+            return lambda name: len(name) >= min_length and name.startswith(prefix) and name.endswith(suffix)
+    regex = compile_glob(pattern)
+    return lambda name: regex.match(name) is not None
+
+
+def glob_match(name: Union[str, Path], pattern: str) -> bool:
+    """
+    Like fnmatch.fnmatch, but with a cache of compiled patterns that is not limited in size.
+    """
+    return _glob_matcher(pattern)(normcase(fspath(name)))
+
+
+def glob_filter(names: Iterable[str], pattern: str) -> List[str]:
+    """
+    Like fnmatch.filter: returns the names that match pattern, looking up the matcher only once.
+    """
+    matcher = _glob_matcher(pattern)
+    return [name for name in names if matcher(normcase(name))]
+
+
 def shorten_list(source: Sequence[T], predicate: Callable[[T], bool], min_items: int = 1) -> Sequence[T]:
     result = [item for item in source if predicate(item)]
     if len(result) < min_items:
@@ -259,5 +426,7 @@ def shorten_list(source: Sequence[T], predicate: Callable[[T], bool], min_items:
         return result
 
 
+@lru_cache(maxsize=4096)
 def parse_http_date(http_date: str) -> datetime:
-    return datetime(*eut.parsedate(http_date)[:6])  # type:ignore
+    from email.utils import parsedate_to_datetime
+    return parsedate_to_datetime(http_date)
@@ -0,0 +1,80 @@
+"""
+Input validators for the interactive prompts of the CLI.
+
+They live in their own module so that prompt_toolkit and tomlkit are only imported by commands that ask questions.
+"""
+import re
+from typing import Collection, List, Optional
+
+import tomlkit
+try:
+    import tomllib  # Python 3.11+, much faster than tomlkit for just checking the syntax
+except ImportError:
+    tomllib = None
+from prompt_toolkit.document import Document
+from prompt_toolkit.validation import ValidationError, Validator
+
+from .utils import glob_filter
+
+
+class FNMatchValidator(Validator):
+
+    def __init__(self, candidates: Collection[str] = tuple(), *,
+                 must_match: Optional[str]=None,
+                 max_matches: Optional[int] = None,
+                 min_matches: Optional[int] = None):
+        super().__init__()
+        self.candidates = tuple(candidates or ())
+        self._candidate_set = frozenset(self.candidates)
+        self.must_match = must_match
+        if must_match is not None and must_match not in self._candidate_set:
+            self.candidates += (must_match,)
+            self._candidate_set |= {must_match}
+        self.max_matches = max_matches
+        self.min_matches = min_matches
+        self._last_text: Optional[str] = None
+        self._last_matches: List[str] = []
+
+    def _narrows_last_pattern(self, text: str) -> bool:
+        """
+        True if everything matching text also matches the previously validated pattern. This is the case
+        if text extends a pattern ending with *, as long as no character classes are involved.
+        """
+        last = self._last_text
+        return last is not None and last.endswith('*') and text.startswith(last) and '[' not in text
+
+    def validate(self, document: Document) -> None:
+        # while the user types, patterns usually get more specific, so we only need to filter the last matches
+        candidates = self._last_matches if self._narrows_last_pattern(document.text) else self.candidates
+        matching_candidates = glob_filter(candidates, document.text)
+        self._last_text, self._last_matches = document.text, matching_candidates
+        matches = set(matching_candidates)
+        if self.must_match is not None and self.must_match not in matches:
+            raise ValidationError(message=f'"{document.text}" does not match {self.must_match}: {matches}')
+        elif self.max_matches is not None and len(matches) > self.max_matches:
+            raise ValidationError(message=f'matches {len(matches)} items ({", ".join(matches)})')
+        elif self.min_matches is not None and len(matches) < self.min_matches:
+            raise ValidationError(message=f'matches only {len(matches)} instead of {self.min_matches} items')
+
+
+_TOMLLIB_ERROR_POSITION = re.compile(r'\(at line (\d+), column (\d+)\)')
+
+
+class TOMLValidator(Validator):
+
+    def validate(self, document: Document):
+        if tomllib is not None:
+            try:
+                tomllib.loads(document.text)
+            except tomllib.TOMLDecodeError as e:
+                position = _TOMLLIB_ERROR_POSITION.search(str(e))
+                if position:
+                    cursor_position = document.translate_row_col_to_index(int(position[1]) - 1, int(position[2]) - 1)
+                else:
+                    cursor_position = len(document.text)
+                raise ValidationError(message=str(e), cursor_position=cursor_position)
+            return
+        try:
+            tomlkit.loads(document.text)
+        except tomlkit.exceptions.ParseError as e:
+            raise ValidationError(message=str(e), cursor_position=document.translate_row_col_to_index(e.line, e.col))
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip('questionary')  # the interactive CLI's dependencies are optional
+from getrel.cli import identifying_pattern
+
+FD_ASSETS = ['fd-v8.4.0-arm-unknown-linux-gnueabihf.tar.gz', 'fd-v8.4.0-arm-unknown-linux-musleabihf.tar.gz',
+             'fd-v8.4.0-aarch64-unknown-linux-gnu.tar.gz', 'fd-v8.4.0-i686-unknown-linux-gnu.tar.gz',
+             'fd-v8.4.0-x86_64-unknown-linux-gnu.tar.gz', 'fd-v8.4.0-x86_64-pc-windows-msvc.zip',
+             'fd_8.4.0_amd64.deb']
+
+
+def test_identifying_pattern():
+    assert identifying_pattern(['foo-windows.tar.gz', 'foo-macos.tar.gz'], 'foo-linux.tar.gz',
+                               avoid_minimal=True) == '*linux*'
+
+
+def test_identifying_pattern_masks_version():
+    pattern = identifying_pattern(FD_ASSETS, 'fd-v8.4.0-arm-unknown-linux-gnueabihf.tar.gz', avoid_minimal=True)
+    assert pattern == '*-v*-arm-unknown-linux-gnueabihf.tar.gz'
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from getrel import config
+from getrel.project import get_project, run_parallel
+
+
+PROJECTS_TOML = '''\
+[fd]
+url = "https://github.com/sharkdp/fd"
+release = "latest"   # or a tag pattern
+
+[fd.assets]
+"*-x86_64-unknown-linux-gnu.tar.gz" = "unpack"
+
+[bat]
+url = "https://github.com/sharkdp/bat"
+release = "latest"
+'''
+
+
+@pytest.fixture
+def projects_toml(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CONFIG_HOME', str(tmp_path / 'config'))
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    caches = (config.config_home, config.data_home, config.edit_projects)
+    for cached in caches:
+        cached.cache_clear()
+    projects_file = config.config_home() / 'projects.toml'
+    projects_file.parent.mkdir(parents=True)
+    projects_file.write_text(PROJECTS_TOML)
+    yield projects_file
+    for cached in caches:
+        cached.cache_clear()
+
+
+def test_run_parallel(projects_toml, monkeypatch):
+    edit_projects = config.edit_projects
+    threads = set()
+
+    def recording_edit_projects():
+        threads.add(threading.current_thread())
+        return edit_projects()
+
+    monkeypatch.setattr(config, 'edit_projects', recording_edit_projects)
+
+    def action(project, release):
+        if project.name == 'fd':
+            project.config['release'] = release
+        elif project.name == 'bat':
+            raise ValueError('failed')
+        return project.config['url']
+
+    projects = [get_project('fd'), get_project('bat')]
+    for release in ['v1*', 'v2*', 'v*']:
+        results = run_parallel(projects, lambda project: action(project, release))
+
+    assert threads == {threading.main_thread()}  # the shared document is only touched by the main thread
+    assert [(p.name, result, type(e)) for p, result, e in results] == [
+        ('fd', 'https://github.com/sharkdp/fd', type(None)),
+        ('bat', None, ValueError)]
+    assert config.edit_projects()['fd']['release'] == 'v*'
+    assert config.edit_projects()['bat']['release'] == 'latest'
+    edit_projects().save()
+    # the changes are merged into the existing tables, so the formatting is kept
+    assert projects_toml.read_text() == PROJECTS_TOML.replace('"latest"   #', '"v*"   #')
@@ -1,9 +1,10 @@
+from pathlib import Path
 from unittest.mock import patch, MagicMock
 
 import pytest
 import requests
 
-from getrel.utils import first, FileType, fetch_if_newer
+from getrel.utils import first, FileType, fetch_if_newer, glob_filter, glob_match, unique_substrings
 
 
 def test_first():
@@ -32,9 +33,43 @@ def test_fetch_if_newer():
     cache = {'ETag': 'test'}
     not_modified = MagicMock()
     not_modified.status_code = requests.codes.not_modified
-    with patch('requests.get', MagicMock(return_value=not_modified)) as get:
+    with patch('requests.Session.get', MagicMock(return_value=not_modified)) as get:
         url = 'https://github.com/foo'
         result = fetch_if_newer(url, cache)
         assert result == False
         assert 'last-request' in cache
-        get.assert_called_once_with(url, headers={'If-None-Match': cache['ETag']})
\ No newline at end of file
+        get.assert_called_once_with(url, headers={'If-None-Match': cache['ETag']})
+
+
+def test_fetch_if_newer_removed_download(tmp_path):
+    cache = {}
+    download_file = tmp_path / 'asset.tar.gz'
+    ok = MagicMock()
+    ok.status_code = requests.codes.ok
+    ok.headers = {'ETag': 'test'}
+    ok.iter_content = MagicMock(side_effect=lambda chunk_size: iter([b'asset']))
+    with patch('requests.Session.get', MagicMock(return_value=ok)) as get:
+        url = 'https://github.com/foo/asset.tar.gz'
+        assert fetch_if_newer(url, cache, download_file=download_file)
+        assert download_file.read_bytes() == b'asset'
+        download_file.unlink()
+        # the last request was just now and the ETag is cached, but the file is gone
+        assert fetch_if_newer(url, cache, download_file=download_file)
+        assert download_file.read_bytes() == b'asset'
+        assert get.call_count == 2
+        assert 'If-None-Match' not in get.call_args[1]['headers']
+
+def test_glob_match():
+    assert glob_match('fd-v8.4.0-x86_64-unknown-linux-musl.tar.gz', 'fd-*-x86_64-unknown-linux-musl.tar.gz')
+    assert glob_match(Path('bin/fd'), '*/fd')
+    assert not glob_match('fd.zip', '*.tar.gz')
+
+
+def test_glob_filter():
+    assert glob_filter(['fd.tar.gz', 'fd.zip', 'fd'], 'fd*') == ['fd.tar.gz', 'fd.zip', 'fd']
+    assert glob_filter(['fd.tar.gz', 'fd.zip', 'fd'], '*.zip') == ['fd.zip']
+    assert glob_filter(['fd.tar.gz', 'fd.zip', 'fd'], 'fd.[tz]*') == ['fd.tar.gz', 'fd.zip']
+
+def test_unique_substrings():
+    assert unique_substrings(['ab', 'abab', 'abc']) == {'abab': 'ba', 'abc': 'c'}
+    assert unique_substrings(['x-darwin.deb', 'x-linux.deb']) == {'x-darwin.deb': 'a', 'x-linux.deb': 'l'}